@@ -1,6 +1,38 @@
 __version__ = "0.2.4"
 
-from .manager import get_manager, CondaManager, MambaManager
 from .logger import ENVPICKER_LOGGER
 
-__all__ = ["get_manager", "CondaManager", "MambaManager"]
+__all__ = [
+    "get_manager",
+    "CondaManager",
+    "MambaManager",
+    "FederatedManager",
+    "PoetryManager",
+    "EnvWatcher",
+]
+
+# the managers and the watcher pull in yaml, wrapconfig and packaging,
+# so they are only imported on first access to keep the startup (e.g. of the cli) fast
+_LAZY_ATTRIBUTES = {
+    "get_manager": ".manager",
+    "CondaManager": ".manager",
+    "MambaManager": ".manager",
+    "FederatedManager": ".manager",
+    "PoetryManager": ".manager",
+    "EnvWatcher": ".watcher",
+}
+
+
+def __getattr__(name):
+    if name in _LAZY_ATTRIBUTES:
+        import importlib
+
+        module = importlib.import_module(_LAZY_ATTRIBUTES[name], __name__)
+        value = getattr(module, name)
+        globals()[name] = value
+        return value
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+def __dir__():
+    return sorted(list(globals()) + list(_LAZY_ATTRIBUTES))
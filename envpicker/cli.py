@@ -0,0 +1,208 @@
+"""
+Command line interface of envpicker.
+
+This module is imported on every call of the console script, so it must stay cheap:
+the managers (and with them yaml, wrapconfig and packaging) are only imported
+inside the subcommands that need them.
+"""
+from __future__ import annotations
+from typing import Optional
+import sys
+import argparse
+
+
+def _get_manager(args: argparse.Namespace, read_only: bool = False):
+    from .manager import get_manager
+
+    # an explicitly requested manager is trusted to be available, and subcommands
+    # that only read the registry do not use the manager tool at all,
+    # probing it would spawn a process on every call
+    return get_manager(
+        path=args.path,
+        preferences=args.manager,
+        check_available=args.manager is None and not read_only,
+    )
+
+
+def cmd_register_all(args: argparse.Namespace) -> int:
+    _get_manager(args).register_all()
+    return 0
+
+
+def cmd_list(args: argparse.Namespace) -> int:
+    mgr = _get_manager(args, read_only=True)
+    for env in mgr.environments:
+        print(f"{env['hash']}\t{env['name']}\t{env['path']}")
+    return 0
+
+
+def cmd_match(args: argparse.Namespace) -> int:
+    mgr = _get_manager(args, read_only=True)
+    found = False
+    for env in mgr.find_matching(args.requirements):
+        found = True
+        print(f"{env['hash']}\t{env['name']}\t{env['path']}")
+        if args.first:
+            break
+    return 0 if found else 1
+
+
+def cmd_pick(args: argparse.Namespace) -> int:
+    mgr = _get_manager(args, read_only=True)
+    envs = mgr.find_for_script(args.script)
+    for env in envs[:1] if args.first else envs:
+        print(f"{env['hash']}\t{env['name']}\t{env['path']}")
+    return 0 if envs else 1
+
+
+def cmd_run(args: argparse.Namespace) -> int:
+    import subprocess
+
+    mgr = _get_manager(args)
+    from .manager.base import ProcessError, NoMatchingEnvironmentError
+
+    if args.requirements:
+        env = next(mgr.find_matching(args.requirements), None)
+        if env is None:
+            print(
+                "No environment matches " + " ".join(args.requirements),
+                file=sys.stderr,
+            )
+            return 1
+    else:
+        # pick by the imports of the script
+        try:
+            env = mgr.first_for_script(args.script)
+        except NoMatchingEnvironmentError as exc:
+            print(str(exc), file=sys.stderr)
+            return 1
+
+    stdout = sys.stdout.buffer
+    stderr = sys.stderr.buffer
+    try:
+        for out, err in mgr.run_pyfile_in_env(
+            env, args.script, args.timeout, mgr.scheduler
+        ):
+            if out:
+                stdout.write(out)
+                stdout.flush()
+            if err:
+                stderr.write(err)
+                stderr.flush()
+    except ProcessError as exc:
+        # the errors were already streamed to stderr
+        return exc.returncode or 1
+    except subprocess.TimeoutExpired:
+        print(f"Timed out after {args.timeout} seconds", file=sys.stderr)
+        # same code as coreutils timeout
+        return 124
+    except RuntimeError as exc:
+        print(str(exc), file=sys.stderr)
+        return 1
+    return 0
+
+
+def cmd_publish_index(args: argparse.Namespace) -> int:
+    print(_get_manager(args).publish_index(args.target))
+    return 0
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(
+        prog="envpicker", description="automatic picking of environments"
+    )
+    parser.add_argument(
+        "--path",
+        default=None,
+        help="registry directory (defaults to $ENV_MANAGER_PATH or ~/.env_manager)",
+    )
+    parser.add_argument(
+        "--manager",
+        action="append",
+        default=None,
+        help="environment manager to use (skips the availability probe), "
+        "can be given multiple times in order of preference",
+    )
+    parser.add_argument(
+        "-v", "--verbose", action="store_true", help="show informational logs"
+    )
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    sp = subparsers.add_parser(
+        "register-all", help="register all environments of the manager"
+    )
+    sp.set_defaults(func=cmd_register_all)
+
+    sp = subparsers.add_parser("list", help="list the registered environments")
+    sp.set_defaults(func=cmd_list)
+
+    sp = subparsers.add_parser(
+        "match", help="list the environments matching all requirements"
+    )
+    sp.add_argument("requirements", nargs="+", help='e.g. "numpy>=1.20"')
+    sp.add_argument(
+        "--first", action="store_true", help="only print the first matching environment"
+    )
+    sp.set_defaults(func=cmd_match)
+
+    sp = subparsers.add_parser(
+        "pick", help="list the environments that can import all modules of a script"
+    )
+    sp.add_argument("script", help="python script to pick an environment for")
+    sp.add_argument(
+        "--first", action="store_true", help="only print the first environment"
+    )
+    sp.set_defaults(func=cmd_pick)
+
+    sp = subparsers.add_parser(
+        "publish-index",
+        help="publish the registry as read-only index for $ENV_MANAGER_SHARED_INDEX",
+    )
+    sp.add_argument("target", help="path of the index file, e.g. on shared storage")
+    sp.set_defaults(func=cmd_publish_index)
+
+    sp = subparsers.add_parser(
+        "run",
+        help="run a script in the first matching environment",
+        usage="envpicker run [requirements ...] -- script.py",
+    )
+    sp.add_argument(
+        "requirements",
+        nargs="*",
+        help='e.g. "numpy>=1.20", picked by the imports of the script if omitted',
+    )
+    sp.add_argument(
+        "--timeout", type=float, default=None, help="wall-clock timeout in seconds"
+    )
+    sp.set_defaults(func=cmd_run)
+
+    return parser
+
+
+def main(argv: Optional[list[str]] = None) -> int:
+    if argv is None:
+        argv = sys.argv[1:]
+    argv = list(argv)
+
+    # everything after "--" is the script to run
+    script_args: Optional[list[str]] = None
+    if "--" in argv:
+        idx = argv.index("--")
+        script_args = argv[idx + 1 :]
+        argv = argv[:idx]
+
+    parser = build_parser()
+    args = parser.parse_args(argv)
+
+    if args.command == "run":
+        if not script_args or len(script_args) != 1:
+            parser.error("run requires exactly one script after '--'")
+        args.script = script_args[0]
+    elif script_args is not None:
+        parser.error("'--' is only supported by the run command")
+
+    from .logger import ENVPICKER_LOGGER
+
+    ENVPICKER_LOGGER.setLevel("INFO" if args.verbose else "WARNING")
+
+    return args.func(args)
@@ -2,34 +2,45 @@ from __future__ import annotations
 from typing import Optional
 from .conda_mngr import CondaManager, MambaManager
 from .base import BaseEnvManager
+from .federated import FederatedManager
+from .poetry_mngr import PoetryManager
 from ..logger import ENVPICKER_LOGGER
 
 PREFERENCE_ORDER = [
     "mamba",
     "conda",
-    #   "poetry",
+    "poetry",
     "venv",
 ]
 
 
+# availability is checked on demand in get_manager, since every check spawns a process
 _MANAGER_CLASSES = {
-    "conda": CondaManager if CondaManager.is_available() else None,
-    "mamba": MambaManager if MambaManager.is_available() else None,
-    #    "poetry": PoetryManager,
+    "conda": CondaManager,
+    "mamba": MambaManager,
+    "federated": FederatedManager,
+    "poetry": PoetryManager,
     #    "venv": VenvManager,
 }
 
 
 def get_manager(
-    path: Optional[str] = None, preferences: Optional[list[str]] = None
+    path: Optional[str] = None,
+    preferences: Optional[list[str]] = None,
+    check_available: bool = True,
 ) -> BaseEnvManager:
-    """Return the first available manager."""
+    """Return the first available manager.
+    If check_available is False, the first known manager is returned without probing
+    its availability, which saves spawning a process per checked manager.
+    """
     if preferences is None:
         preferences = PREFERENCE_ORDER
 
     ENVPICKER_LOGGER.debug("Getting manager from %s", preferences)
     for manager in preferences:
-        if manager in _MANAGER_CLASSES and _MANAGER_CLASSES[manager] is not None:
+        if manager in _MANAGER_CLASSES and (
+            not check_available or _MANAGER_CLASSES[manager].is_available()
+        ):
             ENVPICKER_LOGGER.info(f"Using %s as environment manager.", manager)
             return _MANAGER_CLASSES[manager](path=path)
     raise RuntimeError("No available environment managers found.")
@@ -0,0 +1,145 @@
+from __future__ import annotations
+from typing import Optional, TypedDict, Tuple, Any
+import os
+import sys
+import time
+import threading
+import subprocess
+
+# ru_maxrss is reported in bytes on macOS and in kilobytes elsewhere
+_MAXRSS_UNIT = 1 if sys.platform == "darwin" else 1024
+
+
+class ResourceSummary(TypedDict):
+    runs: int
+    failed: int
+    wall_time: float
+    user_cpu: float
+    sys_cpu: float
+    max_rss: Optional[int]
+    mean_wall_time: float
+    mean_time_to_first_output: Optional[float]
+
+
+def _exitcode(status: int) -> int:
+    if hasattr(os, "waitstatus_to_exitcode"):
+        return os.waitstatus_to_exitcode(status)
+    if os.WIFSIGNALED(status):
+        return -os.WTERMSIG(status)
+    return os.WEXITSTATUS(status)
+
+
+class ProcessReaper:
+    """
+    Waits for the process in a daemon thread, so its exit time and resource usage
+    are recorded when it exits, however slowly its output is consumed.
+    The reaper must be the only one waiting for the process.
+    """
+
+    def __init__(self, proc: subprocess.Popen) -> None:
+        self.proc = proc
+        self.exited_at: Optional[float] = None
+        self.rusage: Any = None
+        self._done = threading.Event()
+        threading.Thread(target=self._wait, daemon=True).start()
+
+    def _wait(self) -> None:
+        try:
+            if hasattr(os, "wait4"):
+                try:
+                    _, status, self.rusage = os.wait4(self.proc.pid, 0)
+                    self.proc.returncode = _exitcode(status)
+                except ChildProcessError:
+                    # reaped elsewhere
+                    self.proc.wait()
+            else:
+                self.proc.wait()
+        finally:
+            self.exited_at = time.perf_counter()
+            self._done.set()
+
+    def done(self) -> bool:
+        return self._done.is_set()
+
+    def wait(self, timeout: Optional[float] = None) -> Tuple[int, Any]:
+        """
+        Return the return code and the rusage (None if not available) of the process.
+        """
+        if not self._done.wait(timeout):
+            raise subprocess.TimeoutExpired(self.proc.args, timeout)
+        return self.proc.returncode, self.rusage
+
+
+def rusage_fields(rusage: Any) -> dict:
+    """
+    Return user and system cpu time and the peak rss (in bytes) of a rusage.
+    """
+    if rusage is None:
+        return {}
+    return {
+        "user_cpu": rusage.ru_utime,
+        "sys_cpu": rusage.ru_stime,
+        "max_rss": rusage.ru_maxrss * _MAXRSS_UNIT,
+    }
+
+
+class ResourceLedger:
+    """
+    Aggregates the RunReports of executed runs per environment hash,
+    e.g. to spot environments with slow interpreter startup or high memory usage.
+    """
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._totals: dict[str, dict] = {}
+
+    def record(self, env_hash: str, report: dict) -> None:
+        with self._lock:
+            totals = self._totals.setdefault(
+                env_hash,
+                {
+                    "runs": 0,
+                    "failed": 0,
+                    "wall_time": 0.0,
+                    "user_cpu": 0.0,
+                    "sys_cpu": 0.0,
+                    "max_rss": None,
+                    "first_output_runs": 0,
+                    "time_to_first_output": 0.0,
+                },
+            )
+            totals["runs"] += 1
+            if report.get("returncode") != 0:
+                totals["failed"] += 1
+            totals["wall_time"] += report.get("run_time") or 0.0
+            totals["user_cpu"] += report.get("user_cpu") or 0.0
+            totals["sys_cpu"] += report.get("sys_cpu") or 0.0
+            if report.get("max_rss") is not None:
+                totals["max_rss"] = max(totals["max_rss"] or 0, report["max_rss"])
+            if report.get("time_to_first_output") is not None:
+                totals["first_output_runs"] += 1
+                totals["time_to_first_output"] += report["time_to_first_output"]
+
+    def summary(self) -> dict[str, ResourceSummary]:
+        with self._lock:
+            return {
+                env_hash: ResourceSummary(
+                    runs=t["runs"],
+                    failed=t["failed"],
+                    wall_time=t["wall_time"],
+                    user_cpu=t["user_cpu"],
+                    sys_cpu=t["sys_cpu"],
+                    max_rss=t["max_rss"],
+                    mean_wall_time=t["wall_time"] / t["runs"],
+                    mean_time_to_first_output=(
+                        t["time_to_first_output"] / t["first_output_runs"]
+                        if t["first_output_runs"]
+                        else None
+                    ),
+                )
+                for env_hash, t in self._totals.items()
+            }
+
+    def clear(self) -> None:
+        with self._lock:
+            self._totals.clear()
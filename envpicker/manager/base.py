@@ -1,6 +1,12 @@
 from __future__ import annotations
-from typing import Optional, TypedDict, Generator, Tuple
+from typing import Optional, TypedDict, Generator, Tuple, Callable, Union
 import os
+import sys
+import time
+import queue
+import threading
+from contextlib import nullcontext
+from concurrent.futures import ThreadPoolExecutor
 from abc import ABC, abstractmethod
 from wrapconfig import YAMLWrapConfig
 import subprocess
@@ -10,11 +16,25 @@ import yaml
 import re
 
 from ..logger import ENVPICKER_LOGGER
+from .scheduler import (
+    RunScheduler,
+    RunReport,
+    empty_run_report,
+    popen_in_group,
+    kill_process_group,
+)
+from .accounting import ResourceLedger, ProcessReaper, rusage_fields
+from .probe_cache import ProbeCache
+from .index import SharedIndex, publish_index
+from .records import EnvRecord, Requirement, shared_version
+from .output import OutputPipeline, TailBuffer, LineFramer, open_sink, read_sink_tail
 from ..utils import (
-    split_version,
     SpecifierSet,
-    matches_version,
-    PackageVersionCondition,
+    exact_pin,
+    package_fingerprint,
+    read_lock_entries,
+    distribution_modules,
+    script_imports,
 )
 
 
@@ -32,12 +52,116 @@ class FullEnvironmentEntry(EnvironmentEntry):
 class EnvYaml(TypedDict):
     name: str
     dependencies: list[str]
+    # fingerprint of the exactly pinned package set, see utils.package_fingerprint
+    fingerprint: str
+
+
+class EnvRunResult(TypedDict):
+    hash: str
+    name: str
+    path: str
+    returncode: Optional[int]
+    duration: float
+    queue_wait: float
+    error: Optional[str]
+    # None if the process could not be started
+    report: Optional[RunReport]
 
 
 class EnvExistsError(Exception):
     pass
 
 
+class NoMatchingEnvironmentError(LookupError):
+    pass
+
+
+class ProcessError(RuntimeError):
+    """
+    Raised if an executed process reports errors,
+    carries the return code and the remaining stderr of the process
+    and, for runs started by the run_*_in_env methods, the RunReport of the run.
+    """
+
+    def __init__(
+        self,
+        stderr: bytes,
+        returncode: Optional[int] = None,
+        report: Optional[RunReport] = None,
+    ) -> None:
+        super().__init__(stderr.decode(errors="replace"))
+        self.stderr = stderr
+        self.returncode = returncode
+        self.report = report
+
+
+# chunks (of up to one pipe buffer each) read ahead of the consumer of stream_process,
+# once the queue is full the readers block and the process blocks on its full pipe
+_MAX_PENDING_CHUNKS = 16
+
+
+def _put_chunk(chunks: queue.Queue, item: tuple, closed: threading.Event) -> bool:
+    """
+    Puts the item into the bounded queue, gives up once closed is set.
+    """
+    while not closed.is_set():
+        try:
+            chunks.put(item, timeout=0.1)
+            return True
+        except queue.Full:
+            continue
+    return False
+
+
+def _read_pipe(
+    pipe, idx: int, chunks: queue.Queue, closed: threading.Event
+) -> None:
+    """
+    Puts everything read from the pipe into the queue, followed by None on EOF.
+    Stops as soon as closed is set, as nobody consumes the queue anymore.
+    """
+    try:
+        while True:
+            data = pipe.read1()
+            if not data or not _put_chunk(chunks, (idx, data), closed):
+                break
+    except (OSError, ValueError):
+        pass
+    finally:
+        _put_chunk(chunks, (idx, None), closed)
+
+
+def print_tagged_output(env: EnvironmentEntry, stdout: bytes, stderr: bytes) -> None:
+    """
+    Default output handler of run_pyfile_in_all_matching,
+    writes the output prefixed with the name and the (shortened) hash of the environment.
+    """
+    tag = f"[{env['name']} {env['hash'][:8]}] ".encode()
+    for data, stream in ((stdout, sys.stdout), (stderr, sys.stderr)):
+        if not data:
+            continue
+        lines = data.splitlines(keepends=True)
+        data = b"".join(tag + line for line in lines)
+        if not lines[-1].endswith(b"\n"):
+            data += b"\n"
+        buffer = getattr(stream, "buffer", None)
+        if buffer is not None:
+            buffer.write(data)
+            buffer.flush()
+        else:
+            # text-only streams, e.g. in notebooks or a StringIO
+            stream.write(data.decode(errors="replace"))
+            stream.flush()
+
+
+# yaml snapshots are named after the md5 path hash of their environment
+_SNAPSHOT_RE = re.compile(r"([0-9a-f]{32})\.yaml")
+
+# section of the module index listing the indexed environments without any
+# distributions, no importable module starts with a dot
+NO_MODULES_KEY = ".empty"
+
+
 def path_hash(path: str) -> str:
     """
     Return the hash of the path as md5
@@ -74,7 +198,19 @@ def is_package_entry(entry: str) -> bool:
 
 
 class BaseEnvManager(ABC):
-    def __init__(self, path: Optional[str] = None) -> None:
+    # relative cost of get_dependencies, used to pick the cheapest manager
+    # for an environment that is visible to several managers
+    EXTRACTION_COST = 100
+
+    def __init__(
+        self,
+        path: Optional[str] = None,
+        max_parallel: Optional[int] = None,
+        max_per_env: Optional[int] = None,
+        shared_index: Optional[str] = None,
+        track_resources: bool = False,
+        probe_cache_size: Optional[int] = None,
+    ) -> None:
         super().__init__()
         if not path:
             path = os.environ.get(
@@ -88,26 +224,250 @@ class BaseEnvManager(ABC):
         self.path = path
 
         self.registry = YAMLWrapConfig(os.path.join(self.path, "registry.yml"))
+        # all changes of the registry and the module index go through this lock,
+        # they are also made by background threads (EnvWatcher, prune_in_background)
+        self.registry_lock = threading.RLock()
+        # limits the processes started by the run_*_in_matching methods
+        self.scheduler = RunScheduler(max_parallel=max_parallel, max_per_env=max_per_env)
+        # resource usage of the runs started by the manager, aggregated per environment
+        self.resource_ledger: Optional[ResourceLedger] = (
+            ResourceLedger() if track_resources else None
+        )
+        # opt-in cache for the output of run_probe, bounded by probe_cache_size bytes
+        self.probe_cache: Optional[ProbeCache] = (
+            ProbeCache(os.path.join(self.path, "probe_cache"), probe_cache_size)
+            if probe_cache_size
+            else None
+        )
+
+        # compact package data of the environments by hash
+        self._records: dict[str, EnvRecord] = {}
+
+        # fingerprint -> environment, built on first use by find_exact
+        self._fingerprints: Optional[dict[str, EnvironmentEntry]] = None
+
+        # module -> {env hash: distribution} index, loaded on first use (see module_index)
+        self._module_index: Optional[YAMLWrapConfig] = None
+        # hashes of the environments whose modules are in the index
+        self._modules_indexed: Optional[set[str]] = None
+
+        # keys of the validated registry entries, see _entry_key
+        self._validated: set[tuple] = set()
+
+        # read-only index published to shared storage, the local registry acts as overlay
+        if shared_index is None:
+            shared_index = os.environ.get("ENV_MANAGER_SHARED_INDEX")
+        self.shared_index: Optional[SharedIndex] = None
+        if shared_index:
+            if os.path.isfile(shared_index):
+                self.shared_index = SharedIndex(shared_index)
+            else:
+                ENVPICKER_LOGGER.warning("Shared index %s not found", shared_index)
 
     @property
     def environments(self) -> list[EnvironmentEntry]:
-        envs = self.registry.get("environments")
-        if not envs:
-            return []
-        return envs
+        with self.registry_lock:
+            # a copy, the registry changes its list in place
+            envs = list(self.registry.get("environments") or [])
+            # entries read from the registry were validated when they were written
+            for env in envs:
+                self._validated.add(self._entry_key(env))
+        if self.shared_index is None:
+            return envs
+        # local entries take precedence over the shared ones
+        local = {env["hash"] for env in envs}
+        return envs + [
+            env for env in self.shared_index.environments if env["hash"] not in local
+        ]
 
     @environments.setter
     def environments(self, envs: list[EnvironmentEntry]):
-        # validate envs
         envs = list(envs)
-        for env in envs:
-            self.validate_env(env)
+        if self.shared_index is not None:
+            # entries of the shared index are not copied into the local overlay
+            envs = [env for env in envs if self.shared_index.get(env["hash"]) != env]
+        with self.registry_lock:
+            self._fingerprints = None
+            # validate only new or changed envs, which saves two stat calls per entry
+            # and keeps a since deleted environment from failing every write (see prune)
+            for env in envs:
+                key = self._entry_key(env)
+                if key in self._validated:
+                    continue
+                self.validate_env(env)
+                self._validated.add(key)
+
+            self.registry.set("environments", envs)
+
+    @staticmethod
+    def _entry_key(env: EnvironmentEntry) -> tuple:
+        return (env["hash"], env["path"], env["name"], env["py_executable"])
 
-        self.registry.set("environments", envs)
+    @staticmethod
+    def _env_exists(env: EnvironmentEntry) -> bool:
+        return os.path.isdir(env["path"]) and os.path.isfile(env["py_executable"])
+
+    def _forget_fingerprints(self, hashes: list[str]) -> None:
+        with self.registry_lock:
+            self._fingerprints = None
+            fingerprints = self.registry.get("fingerprints") or {}
+            stale = [h for h in hashes if h in fingerprints]
+            for h in stale:
+                self.registry.clear("fingerprints", h)
+            if stale:
+                self.registry.save()
+
+    @property
+    def module_index(self) -> YAMLWrapConfig:
+        """
+        Maps the top-level modules importable in the registered environments to the
+        hashes of the environments and the distributions that provide them,
+        stored next to the registry in modules.yml.
+        """
+        if self._module_index is None:
+            self._module_index = YAMLWrapConfig(os.path.join(self.path, "modules.yml"))
+        return self._module_index
+
+    def _forget_modules(self, hashes: list[str], save: bool = True) -> None:
+        with self.registry_lock:
+            index = self.module_index
+            if self._modules_indexed is not None:
+                self._modules_indexed.difference_update(hashes)
+            changed = False
+            for module, providers in list((index.get() or {}).items()):
+                stale = [h for h in hashes if h in (providers or {})]
+                if not stale:
+                    continue
+                changed = True
+                if len(stale) == len(providers):
+                    index.clear(module)
+                    continue
+                for h in stale:
+                    index.clear(module, h)
+            if changed and save:
+                index.save()
+
+    def _index_modules(self, env: EnvironmentEntry, save: bool = True) -> None:
+        """
+        (Re)index the modules provided by the distributions installed in the environment.
+        """
+        modules = distribution_modules(env["path"])
+        with self.registry_lock:
+            self._forget_modules([env["hash"]], save=False)
+            self._add_modules(env, modules)
+            if save:
+                self.module_index.save()
+
+    def _add_modules(
+        self, env: EnvironmentEntry, modules: Optional[dict[str, str]] = None
+    ) -> None:
+        if modules is None:
+            modules = distribution_modules(env["path"])
+        with self.registry_lock:
+            for module, dist in modules.items():
+                self.module_index.set(module, env["hash"], value=dist, save=False)
+            if not modules:
+                # marks the environment as indexed, so it is not scanned again
+                self.module_index.set(
+                    NO_MODULES_KEY, env["hash"], value=True, save=False
+                )
+            if self._modules_indexed is not None:
+                self._modules_indexed.add(env["hash"])
+
+    def _indexed_modules(self) -> YAMLWrapConfig:
+        """
+        Return the module index, after indexing the environments missing in it
+        (e.g. registered before the index existed or served from the shared index).
+        The modules of environments served from the shared index are taken from it
+        if it was published with them, the others are scanned.
+        """
+        with self.registry_lock:
+            index = self.module_index
+            if self._modules_indexed is None:
+                indexed: set[str] = set()
+                for providers in (index.get() or {}).values():
+                    indexed.update(providers or {})
+                self._modules_indexed = indexed
+            missing = [
+                env
+                for env in self.environments
+                if env["hash"] not in self._modules_indexed
+            ]
+            if missing:
+                for env in missing:
+                    modules = None
+                    if self.shared_index is not None:
+                        modules = self.shared_index.modules(env["hash"])
+                    if modules is None:
+                        ENVPICKER_LOGGER.debug(
+                            "Indexing the modules of %s", env["path"]
+                        )
+                    self._add_modules(env, modules)
+                index.save()
+        return index
+
+    def prune(self) -> dict[str, list]:
+        """
+        Remove the local registry entries whose environment is gone and delete
+        the yaml snapshots that belong to no registered environment, in one pass.
+        Returns the removed entries and the deleted files.
+        """
+        # a snapshot written concurrently must not be taken for an orphan
+        with self.registry_lock:
+            envs = self.registry.get("environments") or []
+            keep, removed = [], []
+            for env in envs:
+                (keep if self._env_exists(env) else removed).append(env)
+            if removed:
+                for env in removed:
+                    ENVPICKER_LOGGER.info("Pruning environment %s", env["path"])
+                    self._validated.discard(self._entry_key(env))
+                    self._records.pop(env["hash"], None)
+                # the remaining entries were just checked, no need to validate them again
+                self.registry.set("environments", keep)
+                self._forget_fingerprints([env["hash"] for env in removed])
+                self._forget_modules([env["hash"] for env in removed])
+
+            referenced = {env["hash"] for env in self.environments}
+            files = []
+            for filename in os.listdir(self.path):
+                match = _SNAPSHOT_RE.fullmatch(filename)
+                if match and match.group(1) not in referenced:
+                    filepath = os.path.join(self.path, filename)
+                    os.remove(filepath)
+                    files.append(filepath)
+        return {"environments": removed, "files": files}
+
+    def prune_in_background(self, interval: float) -> threading.Event:
+        """
+        Call prune every interval seconds in a daemon thread until the returned event is set.
+        """
+        stop = threading.Event()
+
+        def _loop():
+            while not stop.wait(interval):
+                try:
+                    self.prune()
+                except Exception:
+                    ENVPICKER_LOGGER.exception("Pruning the registry failed")
+
+        threading.Thread(target=_loop, name="envpicker-prune", daemon=True).start()
+        return stop
+
+    def publish_index(self, target: str) -> str:
+        """
+        Publish all environments and their package data as read-only index to target,
+        which can be used by other managers as shared_index.
+        """
+        return publish_index(self, target)
 
     def env_to_full_env(self, env: EnvironmentEntry) -> FullEnvironmentEntry:
         yaml_path = os.path.join(self.path, f"{env['hash']}.yaml")
         if not os.path.isfile(yaml_path):
+            if self.shared_index is not None and env["hash"] in self.shared_index:
+                return FullEnvironmentEntry(
+                    **env, envdata=self.shared_index.envdata(env["hash"])
+                )
             self.create_env_yaml(env)
         with open(yaml_path, "r") as f:
             envdata = yaml.safe_load(f)
@@ -133,6 +493,34 @@ class BaseEnvManager(ABC):
                 return self.env_to_full_env(env)
         return None
 
+    def remove_env(self, path: str) -> Optional[EnvironmentEntry]:
+        """
+        Remove the environment registered under path together with its yaml snapshot.
+        Returns the removed entry or None if no such environment is registered.
+        """
+        path = os.path.normpath(os.path.abspath(path))
+        with self.registry_lock:
+            envs = self.environments
+            removed = [e for e in envs if e["path"] == path]
+            if not removed:
+                return None
+            ENVPICKER_LOGGER.info("Removing environment %s", path)
+            self.environments = [e for e in envs if e["path"] != path]
+            self._records.pop(removed[0]["hash"], None)
+            self._forget_fingerprints([removed[0]["hash"]])
+            self._forget_modules([removed[0]["hash"]])
+            yaml_path = os.path.join(self.path, f"{removed[0]['hash']}.yaml")
+            if os.path.isfile(yaml_path):
+                os.remove(yaml_path)
+        return removed[0]
+
+    def watch_dirs(self) -> list[str]:
+        """
+        Return the directories in which the manager creates new environments.
+        Used by the EnvWatcher to detect created and deleted environments.
+        """
+        return []
+
     @classmethod
     @abstractmethod
     def is_available(cls) -> bool:
@@ -143,6 +531,48 @@ class BaseEnvManager(ABC):
     def register_all(cls) -> None:
         """Register all available environments."""
 
+    def list_env_paths(self) -> list[str]:
+        """Return the paths of all environments known to the manager."""
+        raise NotImplementedError(
+            f"{type(self).__name__} does not support listing environments"
+        )
+
+    def handles_env(self, env: EnvironmentEntry) -> bool:
+        """Return True if get_dependencies supports the environment."""
+        return True
+
+    def register_paths(self, env_paths: list[str]) -> int:
+        """
+        Register all not yet registered environments among env_paths,
+        named after their directory. Returns the number of registered environments.
+        """
+        r = 0
+        for env_path in env_paths:
+            env = self.get_env_by_path(env_path)
+            if env:
+                continue
+
+            env_name = os.path.basename(
+                env_path
+            )  # by default, use the name of the directory as the environment name
+
+            # Register the environment using add_env function
+            try:
+                self.register_environment(
+                    path=env_path,
+                    py_executable=None,
+                    name=env_name,
+                    force=False,
+                )
+                ENVPICKER_LOGGER.info(
+                    "Successfully registered %s (%s)", env_name, env_path
+                )
+                r += 1
+            except EnvExistsError:
+                continue
+        ENVPICKER_LOGGER.info("Successfully registered %s environments.", r)
+        return r
+
     def register_environment(
         self,
         path: str,
@@ -190,26 +620,27 @@ class BaseEnvManager(ABC):
         new_env = EnvironmentEntry(
             path=path, hash=path_hash(path=path), name=name, py_executable=py_executable
         )
-        env = None
-        env = self.get_env_by_path(path=path)
-        print(env, new_env)
-        if env is not None and not force:
-            raise EnvExistsError("The environment is already registered")
+        with self.registry_lock:
+            env = None
+            env = self.get_env_by_path(path=path)
+            print(env, new_env)
+            if env is not None and not force:
+                raise EnvExistsError("The environment is already registered")
 
-        envs = self.environments
-        if env:
-            env = [e for e in envs if e["path"] == path][0]
-            env.update(new_env)
-        else:
-            env = new_env
-            envs.append(new_env)
+            envs = self.environments
+            if env:
+                env = [e for e in envs if e["path"] == path][0]
+                env.update(new_env)
+            else:
+                env = new_env
+                envs.append(new_env)
 
-        self.environments = envs
+            self.environments = envs
 
-        self.create_env_yaml(env)
-        return self.get_env_by_path(path=path)
+            self.create_env_yaml(env)
+            return self.get_env_by_path(path=path)
 
-    def create_env_yaml(self, env: EnvironmentEntry):
+    def create_env_yaml(self, env: EnvironmentEntry, save: bool = True):
         ENVPICKER_LOGGER.debug("Creating yaml for %s", env["name"])
         yaml_path = os.path.join(self.path, f"{env['hash']}.yaml")
 
@@ -220,10 +651,18 @@ class BaseEnvManager(ABC):
         data = EnvYaml(
             name=env["name"],
             dependencies=dependencies,
+            fingerprint=package_fingerprint(dependencies),
         )
 
-        with open(yaml_path, "w") as f:
-            yaml.dump(data, f)
+        with self.registry_lock:
+            with open(yaml_path, "w") as f:
+                yaml.dump(data, f)
+
+            self.registry.set(
+                "fingerprints", env["hash"], value=data["fingerprint"], save=save
+            )
+            self._fingerprints = None
+        self._index_modules(env, save=save)
 
         # export the environment to yaml
         # if windows
@@ -232,101 +671,672 @@ class BaseEnvManager(ABC):
     def get_dependencies(self, env: EnvironmentEntry) -> list[str]:
         """Return the dependencies of the environment"""
 
+    def _env_record(self, env: EnvironmentEntry) -> EnvRecord:
+        """
+        Return the compact package data of the environment, cached until its yaml snapshot changes.
+        """
+        yaml_path = os.path.join(self.path, f"{env['hash']}.yaml")
+        record = self._records.get(env["hash"])
+        try:
+            st = os.stat(yaml_path)
+            stamp = (st.st_mtime_ns, st.st_size)
+        except OSError:
+            stamp = None
+            if self.shared_index is not None and env["hash"] in self.shared_index:
+                stamp = ("shared", self.shared_index.path)
+        if record is not None and stamp is not None and record.stamp == stamp:
+            return record
+
+        full_env = self.env_to_full_env(
+            EnvironmentEntry(**{k: v for k, v in env.items() if k != "envdata"})
+        )
+        if stamp is None:
+            # the snapshot was just created
+            st = os.stat(yaml_path)
+            stamp = (st.st_mtime_ns, st.st_size)
+        record = EnvRecord(env["hash"], full_env["envdata"]["dependencies"], stamp)
+        self._records[env["hash"]] = record
+        return record
+
     def find_matching(
         self, required_dependencies: list[str]
     ) -> Generator[str, None, None]:
-        split_deps: list[PackageVersionCondition] = [
-            split_version(dep) for dep in required_dependencies
-        ]
+        requirements = [Requirement(dep) for dep in required_dependencies]
         envs = self.environments
 
         for env in envs:
-            matches = True
-            full_env = self.env_to_full_env(env)
-            packages = full_env["envdata"]["dependencies"]
-            packages = [split_version(dep) for dep in packages]
-            packages = {dep["pkg"].lower(): dep for dep in packages}
-            for required_dep in split_deps:
-                if required_dep["pkg"].lower() not in packages:
-                    matches = False
-                    break
-                if not matches_version(
-                    required_dep["vstring"],
-                    packages[required_dep["pkg"].lower()]["vstring"],
-                ):
-                    matches = False
+            if not self._env_record(env).unmet(requirements, first_only=True):
+                yield env
+
+    def unmet_requirements(
+        self, env: EnvironmentEntry, required_dependencies: list[str]
+    ) -> list[str]:
+        """
+        Return the required dependencies that are missing or out of range in the environment.
+        """
+        requirements = [Requirement(dep) for dep in required_dependencies]
+        return [r.entry for r in self._env_record(env).unmet(requirements)]
+
+    def _fingerprint_index(self) -> dict[str, EnvironmentEntry]:
+        """
+        Return the registered environments by the fingerprint of their package set.
+        Fingerprints missing in the registry (e.g. of older snapshots) are filled in.
+        The index is built once and rebuilt after the registered environments
+        or their snapshots changed.
+        """
+        with self.registry_lock:
+            if self._fingerprints is not None:
+                return self._fingerprints
+            fingerprints = self.registry.get("fingerprints") or {}
+            index = {}
+            for env in self.environments:
+                fingerprint = fingerprints.get(env["hash"])
+                if fingerprint is None:
+                    envdata = self.env_to_full_env(env)["envdata"]
+                    fingerprint = envdata.get("fingerprint") or package_fingerprint(
+                        envdata["dependencies"]
+                    )
+                    self.registry.set("fingerprints", env["hash"], value=fingerprint)
+                index.setdefault(fingerprint, env)
+            self._fingerprints = index
+            return index
+
+    def find_exact(
+        self, lock: Union[str, list[str]]
+    ) -> Optional[EnvironmentEntry]:
+        """
+        Return the environment whose package set is exactly the locked one, or None.
+
+        lock is a list of entries or a lockfile (see utils.read_lock_entries).
+        A fully pinned lock is resolved by a single lookup of its content fingerprint.
+        If the lock contains entries that are no exact pins, environments with the same
+        package names are compared by their pins, and only the remaining entries are
+        range matched.
+        """
+        entries = read_lock_entries(lock)
+        pins = {}
+        ranges = []
+        for entry in entries:
+            pin = exact_pin(entry)
+            if pin is None:
+                ranges.append(entry)
+            else:
+                pins[pin[0]] = pin[1]
+
+        if not ranges:
+            return self._fingerprint_index().get(package_fingerprint(entries))
+
+        requirements = [Requirement(entry) for entry in ranges]
+        # names of the records and requirements are normalized like exact_pin does
+        names = set(pins) | {r.name for r in requirements}
+        versions = {name: shared_version(version) for name, version in pins.items()}
+        for env in self.environments:
+            record = self._env_record(env)
+            if record.packages.keys() != names:
+                continue
+            if any(
+                record.packages[name].version != version
+                for name, version in versions.items()
+            ):
+                continue
+            if not record.unmet(requirements, first_only=True):
+                return env
+        return None
+
+    def find_closest(
+        self, required_dependencies: list[str]
+    ) -> Optional[Tuple[EnvironmentEntry, list[str]]]:
+        """
+        Return the environment with the fewest unmet requirements together with
+        the unmet requirements, or None if no environment is registered.
+        """
+        closest = None
+        for env in self.environments:
+            try:
+                unmet = self.unmet_requirements(env, required_dependencies)
+            except Exception as exc:
+                ENVPICKER_LOGGER.debug("Skipping %s: %s", env["path"], exc)
+                continue
+            if closest is None or len(unmet) < len(closest[1]):
+                closest = (env, unmet)
+                if not unmet:
                     break
+        return closest
 
-            if matches:
-                yield env
+    def provision(self, required_dependencies: list[str]) -> FullEnvironmentEntry:
+        """
+        Create and register an environment satisfying the required dependencies.
+        Not supported by all managers.
+        """
+        raise NoMatchingEnvironmentError(
+            f"No environment matches {required_dependencies} and "
+            f"{type(self).__name__} can not provision new environments"
+        )
+
+    def first_matching(
+        self, required_dependencies: list[str], provision: bool = False
+    ) -> EnvironmentEntry:
+        """
+        Return the first matching environment. If none matches and provision is True,
+        a new environment is provisioned, otherwise a NoMatchingEnvironmentError is raised.
+        """
+        env = next(self.find_matching(required_dependencies), None)
+        if env is not None:
+            return env
+        if provision:
+            full_env = self.provision(required_dependencies)
+            return EnvironmentEntry(
+                **{k: v for k, v in full_env.items() if k != "envdata"}
+            )
+        raise NoMatchingEnvironmentError(
+            f"No environment matches {required_dependencies}"
+        )
+
+    def script_requirements(self, path: str) -> dict[str, Optional[str]]:
+        """
+        Return the top-level modules the script at path imports (see utils.script_imports),
+        mapped to the distribution that provides them, None if no registered environment does.
+        """
+        index = self._indexed_modules()
+        requirements = {}
+        for module in script_imports(path):
+            providers = index.get(module) or {}
+            requirements[module] = next(iter(providers.values()), None)
+        return requirements
+
+    def find_for_script(self, path: str) -> list[EnvironmentEntry]:
+        """
+        Return the environments in which all modules imported by the script at path
+        are installed, using the module index built at registration.
+        """
+        index = self._indexed_modules()
+        candidates: Optional[set] = None
+        for module in script_imports(path):
+            providers = set(index.get(module) or {})
+            candidates = providers if candidates is None else candidates & providers
+            if not candidates:
+                return []
+        envs = self.environments
+        if candidates is None:
+            # no third-party imports
+            return envs
+        return [env for env in envs if env["hash"] in candidates]
+
+    def first_for_script(self, path: str, provision: bool = False) -> EnvironmentEntry:
+        """
+        Return the first environment that can import all modules of the script at path.
+        If none can and provision is True, an environment with the providing
+        distributions is provisioned, otherwise a NoMatchingEnvironmentError is raised.
+        """
+        envs = self.find_for_script(path)
+        if envs:
+            return envs[0]
+        requirements = self.script_requirements(path)
+        unknown = sorted(m for m, dist in requirements.items() if dist is None)
+        if unknown:
+            raise NoMatchingEnvironmentError(
+                f"No registered environment provides {', '.join(unknown)}"
+            )
+        dists = sorted(set(requirements.values()))
+        if provision:
+            full_env = self.provision(dists)
+            return EnvironmentEntry(
+                **{k: v for k, v in full_env.items() if k != "envdata"}
+            )
+        raise NoMatchingEnvironmentError(f"No environment provides all of {dists}")
 
     @staticmethod
     def stream_process(
         proc: subprocess.Popen,
-    ) -> Generator[Tuple[bytes, bytes], None, None]:
-        # Stream the output continuously
-        while True:
-            output_stdout = proc.stdout.read1()
-            output_stderr = proc.stderr.read1()
-            if output_stdout or output_stderr:
-                yield output_stdout or b"", output_stderr or b""
-            if proc.poll() is not None:
-                break
-        yield b"\n", b"\n"
-        _, errors = proc.communicate()
+        timeout: Optional[float] = None,
+        output: Optional[OutputPipeline] = None,
+        report: Optional[dict] = None,
+    ) -> Generator[Tuple[bytes, bytes], None, Optional[int]]:
+        """
+        Streams the output of the process and returns its return code.
+        If report is given, the time to the first output and the resource usage
+        of the process are written to it (see RunReport).
+        The process is expected to be started via popen_in_group: once it exits,
+        is closed early or exceeds the timeout, its whole process group is killed.
+        Raises a ProcessError with the tail of stderr if the process exits with
+        a non-zero return code and subprocess.TimeoutExpired if it runs longer
+        than timeout seconds.
+        """
+        if output is None:
+            output = OutputPipeline()
+        chunks: queue.Queue = queue.Queue(maxsize=_MAX_PENDING_CHUNKS)
+        closed = threading.Event()
+        open_pipes = 0
+        for idx, pipe in enumerate((proc.stdout, proc.stderr)):
+            if pipe is None:
+                continue
+            open_pipes += 1
+            threading.Thread(
+                target=_read_pipe, args=(pipe, idx, chunks, closed), daemon=True
+            ).start()
+        framers = (
+            [LineFramer(output.max_line), LineFramer(output.max_line)]
+            if output.lines
+            else None
+        )
+        started = time.perf_counter()
+        # records the exit time and the resource usage (via wait4) of the process,
+        # independent of the time the generator is suspended by its consumer
+        reaper = ProcessReaper(proc)
+        deadline = None if timeout is None else time.monotonic() + timeout
+        exited = False
+        first_output = None
+        errors = TailBuffer(output.tail_size)
+        try:
+            # Stream the output continuously
+            while open_pipes:
+                wait = 0.1
+                if deadline is not None:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        raise subprocess.TimeoutExpired(proc.args, timeout)
+                    wait = min(wait, remaining)
+                try:
+                    idx, data = chunks.get(timeout=wait)
+                except queue.Empty:
+                    if not exited and reaper.done():
+                        # orphaned children might still hold the pipes open
+                        exited = True
+                        kill_process_group(proc)
+                    continue
+                if data is None:
+                    open_pipes -= 1
+                    if framers is None:
+                        continue
+                    data = framers[idx].flush()
+                    if data is None:
+                        continue
+                    pieces = [data]
+                else:
+                    if first_output is None:
+                        first_output = time.perf_counter() - started
+                    if idx == 1:
+                        errors.write(data)
+                    pieces = [data] if framers is None else framers[idx].feed(data)
+                for piece in pieces:
+                    yield (piece, b"") if idx == 0 else (b"", piece)
+            if not output.lines:
+                yield b"\n", b"\n"
+            returncode, _ = reaper.wait(
+                None if deadline is None else max(0, deadline - time.monotonic())
+            )
+        finally:
+            closed.set()
+            kill_process_group(proc)
+            _, rusage = reaper.wait()
+            if report is not None:
+                report["run_time"] = reaper.exited_at - started
+                report["time_to_first_output"] = first_output
+                report.update(rusage_fields(rusage))
+
+        if returncode != 0:
+            raise ProcessError(
+                errors.getvalue() or f"Process exited with {returncode}".encode(),
+                returncode,
+            )
+        return returncode
+
+    @staticmethod
+    def _run_in_env(
+        env: dict,
+        args: list[str],
+        timeout: Optional[float] = None,
+        scheduler: Optional[RunScheduler] = None,
+        output: Optional[OutputPipeline] = None,
+    ) -> Generator[Tuple[bytes, bytes], None, RunReport]:
+        if output is None:
+            output = OutputPipeline()
+        queued = time.perf_counter()
+        report = empty_run_report()
+        with scheduler.slot(env["hash"]) if scheduler else nullcontext():
+            started = time.perf_counter()
+            report["queue_wait"] = started - queued
+            to_close = []
+            try:
+                targets = []
+                for sink in (output.stdout, output.stderr):
+                    if sink is None:
+                        targets.append(subprocess.PIPE)
+                        continue
+                    target, opened = open_sink(sink)
+                    targets.append(target)
+                    if opened is not None:
+                        to_close.append(opened)
+                with popen_in_group(
+                    args,
+                    stdout=targets[0],
+                    stderr=targets[1],
+                ) as proc:
+                    report["returncode"] = yield from BaseEnvManager.stream_process(
+                        proc, timeout, output, report
+                    )
+            except ProcessError as exc:
+                report["returncode"] = exc.returncode
+                tail = None
+                if output.stderr is not None:
+                    for f in to_close:
+                        f.flush()
+                    tail = read_sink_tail(output.stderr, output.tail_size)
+                raise ProcessError(
+                    tail or exc.stderr, exc.returncode, report
+                ) from None
+            finally:
+                for f in to_close:
+                    f.close()
+        ENVPICKER_LOGGER.debug(
+            "Run in %s waited %.3fs and ran %.3fs (cpu %s/%s, max rss %s)",
+            env["hash"],
+            report["queue_wait"],
+            report["run_time"],
+            report["user_cpu"],
+            report["sys_cpu"],
+            report["max_rss"],
+        )
+        return report
+
+    @staticmethod
+    def with_report(
+        run: Generator[Tuple[bytes, bytes], None, RunReport],
+    ) -> Tuple[Generator[Tuple[bytes, bytes], None, RunReport], RunReport]:
+        """
+        Wraps the generator of a run_* method and returns it together with its RunReport,
+        the report is filled once the generator is exhausted (or raised a ProcessError):
+
+            output, report = BaseEnvManager.with_report(manager.run_py_in_env(env, cmd))
+            for out, err in output:
+                ...
+            print(report["run_time"], report["max_rss"])
+        """
+        report = empty_run_report()
 
-        if errors:
-            raise RuntimeError(errors.decode())
+        def _run():
+            try:
+                result = yield from run
+            except ProcessError as exc:
+                if exc.report is not None:
+                    report.update(exc.report)
+                raise
+            report.update(result)
+            return report
+
+        return _run(), report
+
+    def _record_run(
+        self,
+        env: EnvironmentEntry,
+        run: Generator[Tuple[bytes, bytes], None, RunReport],
+    ) -> Generator[Tuple[bytes, bytes], None, RunReport]:
+        """
+        Adds the RunReport of the run to the resource ledger, if resources are tracked.
+        """
+        if self.resource_ledger is None:
+            return (yield from run)
+        try:
+            report = yield from run
+        except ProcessError as exc:
+            if exc.report is not None:
+                self.resource_ledger.record(env["hash"], exc.report)
+            raise
+        self.resource_ledger.record(env["hash"], report)
+        return report
 
     @staticmethod
     def run_py_in_env(
-        env: dict, command: str
-    ) -> Generator[Tuple[bytes, bytes], None, None]:
+        env: dict,
+        command: str,
+        timeout: Optional[float] = None,
+        scheduler: Optional[RunScheduler] = None,
+        output: Optional[OutputPipeline] = None,
+    ) -> Generator[Tuple[bytes, bytes], None, RunReport]:
         """
         Calls the Python executable from the specified envirbonment and executes the given command.
-        Yields the output line by line.
+        Yields the output line by line and returns a RunReport with the return code,
+        the time spent waiting for the scheduler, the run time and the resource usage
+        (see with_report to get the report alongside the generator).
+        How the output is delivered (chunks, lines or directly to files) is set by output.
         """
         py_executable_path = env["py_executable"]
         # Start the command with the specified Python executable
-        with subprocess.Popen(
-            [py_executable_path, "-u", "-c", command],
-            stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE,
-        ) as proc:
-            yield from BaseEnvManager.stream_process(proc)
+        return (
+            yield from BaseEnvManager._run_in_env(
+                env,
+                [py_executable_path, "-u", "-c", command],
+                timeout,
+                scheduler,
+                output,
+            )
+        )
 
     def run_py_in_matching(
-        self, required_dependencies: list[str], command: str
-    ) -> Generator[bytes, None, None]:
+        self,
+        required_dependencies: list[str],
+        command: str,
+        timeout: Optional[float] = None,
+        output: Optional[OutputPipeline] = None,
+        provision: bool = False,
+    ) -> Generator[bytes, None, RunReport]:
         """
         Runs the given command in the first matching environment.
+        If provision is True, a missing environment is provisioned first.
         """
-        env = next(self.find_matching(required_dependencies))
-        yield from self.run_py_in_env(env, command)
+        env = self.first_matching(required_dependencies, provision=provision)
+        return (
+            yield from self._record_run(
+                env,
+                self.run_py_in_env(env, command, timeout, self.scheduler, output),
+            )
+        )
 
     @staticmethod
     def run_pyfile_in_env(
-        env: dict, path: str
-    ) -> Generator[Tuple[bytes, bytes], None, None]:
+        env: dict,
+        path: str,
+        timeout: Optional[float] = None,
+        scheduler: Optional[RunScheduler] = None,
+        output: Optional[OutputPipeline] = None,
+    ) -> Generator[Tuple[bytes, bytes], None, RunReport]:
         """
         Calls the Python executable from the specified envirbonment and executes the given command.
-        Yields the output line by line.
+        Yields the output line by line and returns a RunReport with the return code,
+        the time spent waiting for the scheduler, the run time and the resource usage
+        (see with_report to get the report alongside the generator).
+        How the output is delivered (chunks, lines or directly to files) is set by output.
         """
         py_executable_path = env["py_executable"]
         path = os.path.abspath(path)
         # Start the command with the specified Python executable
-        with subprocess.Popen(
-            [py_executable_path, "-u", path],
-            stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE,
-        ) as proc:
-            yield from BaseEnvManager.stream_process(proc)
+        return (
+            yield from BaseEnvManager._run_in_env(
+                env, [py_executable_path, "-u", path], timeout, scheduler, output
+            )
+        )
 
     def run_pyfile_in_matching(
-        self, required_dependencies: list[str], path: str
-    ) -> Generator[Tuple[bytes, bytes], None, None]:
+        self,
+        required_dependencies: list[str],
+        path: str,
+        timeout: Optional[float] = None,
+        output: Optional[OutputPipeline] = None,
+        provision: bool = False,
+    ) -> Generator[Tuple[bytes, bytes], None, RunReport]:
         """
         Runs the given command in the first matching environment.
+        If provision is True, a missing environment is provisioned first.
         """
-        env = next(self.find_matching(required_dependencies))
-        yield from self.run_pyfile_in_env(env, path)
+        env = self.first_matching(required_dependencies, provision=provision)
+        return (
+            yield from self._record_run(
+                env,
+                self.run_pyfile_in_env(env, path, timeout, self.scheduler, output),
+            )
+        )
+
+    def _env_fingerprint(self, env: EnvironmentEntry) -> Optional[str]:
+        fingerprint = self.registry.get("fingerprints", env["hash"])
+        if fingerprint is None:
+            envdata = self.env_to_full_env(env).get("envdata") or {}
+            fingerprint = envdata.get("fingerprint")
+        return fingerprint
+
+    def run_probe(
+        self,
+        env: EnvironmentEntry,
+        command: str,
+        timeout: Optional[float] = None,
+    ) -> Generator[Tuple[bytes, bytes], None, RunReport]:
+        """
+        Runs a deterministic probe command (e.g. "import numpy; print(numpy.__version__)")
+        in the environment. If the manager was created with a probe_cache_size, the output
+        of successful probes is cached until the environment changes and replayed
+        without starting a process.
+        """
+        run = self._record_run(
+            env, self.run_py_in_env(env, command, timeout, self.scheduler)
+        )
+        if self.probe_cache is None:
+            return (yield from run)
+
+        key = ProbeCache.key(env["hash"], self._env_fingerprint(env), command)
+        cached = self.probe_cache.get(key, env["path"])
+        if cached is not None:
+            run.close()
+            ENVPICKER_LOGGER.debug("Probe cache hit in %s", env["hash"])
+            for chunk in cached:
+                yield chunk
+            report = empty_run_report()
+            report["returncode"] = 0
+            return report
+
+        chunks = []
+        try:
+            while True:
+                try:
+                    chunk = next(run)
+                except StopIteration as stop:
+                    report = stop.value
+                    break
+                chunks.append(chunk)
+                yield chunk
+        finally:
+            run.close()
+        if report["returncode"] == 0:
+            self.probe_cache.put(key, env["path"], chunks)
+        return report
+
+    def run_pyfile_by_imports(
+        self,
+        path: str,
+        timeout: Optional[float] = None,
+        output: Optional[OutputPipeline] = None,
+        provision: bool = False,
+    ) -> Generator[Tuple[bytes, bytes], None, RunReport]:
+        """
+        Runs the given file in the first environment that can import all of its modules.
+        If provision is True, a missing environment is provisioned first.
+        """
+        env = self.first_for_script(path, provision=provision)
+        return (
+            yield from self._record_run(
+                env,
+                self.run_pyfile_in_env(env, path, timeout, self.scheduler, output),
+            )
+        )
+
+    def run_pyfile_in_all_matching(
+        self,
+        required_dependencies: list[str],
+        path: str,
+        max_parallel: Optional[int] = None,
+        on_output: Optional[
+            Callable[[EnvironmentEntry, bytes, bytes], None]
+        ] = print_tagged_output,
+        timeout: Optional[float] = None,
+    ) -> list[EnvRunResult]:
+        """
+        Runs the given file in all matching environments, at most max_parallel
+        (defaults to the number of cpus) at the same time.
+        The runs are additionally subject to the limits of the manager's scheduler.
+        The output is passed to on_output together with the environment,
+        by default it is printed tagged with the name and hash of the environment.
+        Returns the return code and the duration of the run for every environment.
+        """
+        envs = list(self.find_matching(required_dependencies))
+        if not envs:
+            return []
+        if max_parallel is None:
+            max_parallel = os.cpu_count() or 1
+        events: queue.Queue = queue.Queue()
+
+        def _run(env: EnvironmentEntry) -> None:
+            start = time.perf_counter()
+            returncode = None
+            queue_wait = 0.0
+            error = None
+            report = None
+            try:
+                # line framing keeps the tagged output of parallel runs readable
+                gen = self._record_run(
+                    env,
+                    self.run_pyfile_in_env(
+                        env, path, timeout, self.scheduler, OutputPipeline(lines=True)
+                    ),
+                )
+                while True:
+                    try:
+                        out, err = next(gen)
+                    except StopIteration as stop:
+                        report = stop.value
+                        returncode = report["returncode"]
+                        queue_wait = report["queue_wait"]
+                        break
+                    events.put((env, out, err))
+            except ProcessError as exc:
+                returncode = exc.returncode
+                error = str(exc)
+                report = exc.report
+                if report is not None:
+                    queue_wait = report["queue_wait"]
+            except Exception as exc:
+                error = str(exc) or type(exc).__name__
+            events.put(
+                (
+                    env,
+                    EnvRunResult(
+                        hash=env["hash"],
+                        name=env["name"],
+                        path=env["path"],
+                        returncode=returncode,
+                        duration=time.perf_counter() - start,
+                        queue_wait=queue_wait,
+                        error=error,
+                        report=report,
+                    ),
+                    None,
+                )
+            )
+
+        results: dict[str, EnvRunResult] = {}
+        with ThreadPoolExecutor(max_workers=max_parallel) as executor:
+            for env in envs:
+                executor.submit(_run, env)
+            # the output handler is called from the calling thread only
+            while len(results) < len(envs):
+                env, out, err = events.get()
+                if err is None:
+                    results[env["hash"]] = out
+                    ENVPICKER_LOGGER.info(
+                        "%s finished in %s with return code %s (%.2fs)",
+                        path,
+                        env["name"],
+                        out["returncode"],
+                        out["duration"],
+                    )
+                elif on_output is not None:
+                    on_output(env, out, err)
+
+        return [results[env["hash"]] for env in envs]
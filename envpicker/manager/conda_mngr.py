@@ -1,21 +1,49 @@
 from __future__ import annotations
 from typing import Optional
-from .base import BaseEnvManager, EnvExistsError, EnvironmentEntry, is_package_entry
+from .base import (
+    BaseEnvManager,
+    EnvExistsError,
+    EnvironmentEntry,
+    FullEnvironmentEntry,
+    NoMatchingEnvironmentError,
+    is_package_entry,
+)
 import subprocess
+import hashlib
 import json
 import os
 import yaml
+import re
 from ..logger import ENVPICKER_LOGGER
+from ..utils import normalize_name, split_version
+
+
+def _pip_spec(entry: str) -> str:
+    """
+    Convert a conda style pin ("numpy=1.19") into a pip requirement ("numpy==1.19").
+    """
+    return re.sub(r"(?<![<>=!~])=(?!=)", "==", entry)
 
 
 class CondaManager(BaseEnvManager):
     CONDACMD = "conda"
+    # "conda env export" starts conda and loads its whole state
+    EXTRACTION_COST = 100
 
     def __init__(self, *args, **kwargs) -> None:
         super().__init__(*args, **kwargs)
-        self.condainfo = json.loads(
-            subprocess.check_output([self.CONDACMD, "info", "--json"]).decode("utf-8")
-        )
+        self._condainfo: Optional[dict] = None
+
+    @property
+    def condainfo(self) -> dict:
+        # "conda info" is slow, so it is only called once it is actually needed
+        if self._condainfo is None:
+            self._condainfo = json.loads(
+                subprocess.check_output([self.CONDACMD, "info", "--json"]).decode(
+                    "utf-8"
+                )
+            )
+        return self._condainfo
 
     @classmethod
     def is_available(cls) -> bool:
@@ -25,41 +53,24 @@ class CondaManager(BaseEnvManager):
         except Exception:
             return False
 
-    def register_all(self) -> None:
-        """Register all available environments."""
+    def watch_dirs(self) -> list[str]:
+        return list(self.condainfo.get("envs_dirs", []))
 
+    def handles_env(self, env: EnvironmentEntry) -> bool:
+        return os.path.isdir(os.path.join(env["path"], "conda-meta"))
+
+    def list_env_paths(self) -> list[str]:
         env_list_output = subprocess.check_output(
             [self.CONDACMD, "env", "list", "--json"]
         )
         env_list_json = json.loads(env_list_output.decode("utf-8"))
-        environments = env_list_json["envs"]
-        r = 0
-        for env_path in environments:
-            env = self.get_env_by_path(env_path)
-            if env:
-                continue
-
-            env_name = os.path.basename(
-                env_path
-            )  # by default, use the name of the directory as the environment name
-
-            # Register the environment using add_env function
-            try:
-                self.register_environment(
-                    path=env_path,
-                    py_executable=None,
-                    name=env_name,
-                    force=False,
-                )
-                ENVPICKER_LOGGER.info(
-                    "Successfully registered %s (%s)", env_name, env_path
-                )
-                r += 1
-            except EnvExistsError:
-                continue
-        ENVPICKER_LOGGER.info("Successfully registered %s environments.", r)
+        return env_list_json["envs"]
 
-    def get_dependencies(self, env: EnvironmentEntry):
+    def register_all(self) -> None:
+        """Register all available environments."""
+        self.register_paths(self.list_env_paths())
+
+    def _export(self, env: EnvironmentEntry) -> dict:
         yaml_string = subprocess.check_output(
             [
                 self.CONDACMD,
@@ -71,7 +82,10 @@ class CondaManager(BaseEnvManager):
             ]
         )
         yaml_string = yaml_string.decode("utf-8")
-        data = yaml.safe_load(yaml_string)
+        return yaml.safe_load(yaml_string)
+
+    def get_dependencies(self, env: EnvironmentEntry):
+        data = self._export(env)
         deps = []
         for entry in data["dependencies"]:
             if is_package_entry(entry):
@@ -84,6 +98,127 @@ class CondaManager(BaseEnvManager):
 
         return deps
 
+    def pip_packages(self, env: EnvironmentEntry) -> set[str]:
+        """
+        Return the normalized names of the packages installed via pip into the environment.
+        """
+        names = set()
+        for entry in self._export(env)["dependencies"]:
+            if isinstance(entry, dict):
+                for pip_entry in entry.get("pip") or []:
+                    if is_package_entry(pip_entry):
+                        names.add(normalize_name(split_version(pip_entry)["pkg"]))
+        return names
+
+    def _remove_provisioned(self, target: str) -> None:
+        """
+        Unregister and delete an environment that provision failed to set up.
+        """
+        ENVPICKER_LOGGER.info("Removing the failed environment %s", target)
+        self.remove_env(target)
+        try:
+            subprocess.check_output(
+                [self.CONDACMD, "remove", "--all", "--yes", "--quiet", "-p", target]
+            )
+        except subprocess.CalledProcessError:
+            ENVPICKER_LOGGER.exception("Failed to remove %s", target)
+
+    def provision(
+        self, required_dependencies: list[str], name: Optional[str] = None
+    ) -> FullEnvironmentEntry:
+        """
+        Create and register an environment satisfying the required dependencies.
+
+        The registered environment with the fewest unmet requirements is cloned via
+        "conda create --clone" and only the missing or out of range packages are installed
+        into the clone, which avoids a full solve from scratch. Packages that were
+        installed via pip into the cloned environment are updated with the pip of the clone.
+        If no environment is registered, a new one is created from the requirements.
+        An environment that does not satisfy the requirements in the end is removed again.
+        """
+        if name is None:
+            name = (
+                "envpicker-"
+                + hashlib.md5(
+                    "\n".join(sorted(required_dependencies)).encode()
+                ).hexdigest()[:10]
+            )
+        envs_dirs = self.watch_dirs()
+        if not envs_dirs:
+            raise NoMatchingEnvironmentError(
+                "No conda envs_dirs available to provision an environment in"
+            )
+        target = os.path.join(envs_dirs[0], name)
+        if os.path.exists(target):
+            raise EnvExistsError(f"The environment {target} already exists")
+
+        closest = self.find_closest(required_dependencies)
+        if closest is None:
+            ENVPICKER_LOGGER.info("Creating environment %s from scratch", target)
+            subprocess.check_output(
+                [self.CONDACMD, "create", "--yes", "--quiet", "-p", target]
+                + list(required_dependencies)
+            )
+        else:
+            source, unmet = closest
+            ENVPICKER_LOGGER.info(
+                "Cloning %s to %s, installing %s", source["path"], target, unmet
+            )
+            subprocess.check_output(
+                [
+                    self.CONDACMD,
+                    "create",
+                    "--yes",
+                    "--quiet",
+                    "--clone",
+                    source["path"],
+                    "-p",
+                    target,
+                ]
+            )
+
+        try:
+            if closest is not None and unmet:
+                self._install_unmet(source, target, unmet)
+            env = self.register_environment(path=target, name=name)
+            unmet = self.unmet_requirements(env, required_dependencies)
+            if unmet:
+                raise NoMatchingEnvironmentError(
+                    f"The provisioned environment {target} does not satisfy {unmet}"
+                )
+        except BaseException:
+            # otherwise every further attempt fails with EnvExistsError
+            self._remove_provisioned(target)
+            raise
+        return env
+
+    def _install_unmet(
+        self, source: EnvironmentEntry, target: str, unmet: list[str]
+    ) -> None:
+        pip_names = self.pip_packages(source)
+        via_pip = [
+            entry
+            for entry in unmet
+            if normalize_name(split_version(entry)["pkg"]) in pip_names
+        ]
+        via_conda = [entry for entry in unmet if entry not in via_pip]
+        if via_conda:
+            subprocess.check_output(
+                [self.CONDACMD, "install", "--yes", "--quiet", "-p", target]
+                + via_conda
+            )
+        if via_pip:
+            py_executable = (
+                os.path.join(target, "python.exe")
+                if os.name == "nt"
+                else os.path.join(target, "bin", "python")
+            )
+            subprocess.check_output(
+                [py_executable, "-m", "pip", "install", "--quiet"]
+                + [_pip_spec(entry) for entry in via_pip]
+            )
+
 
 class MambaManager(CondaManager):
     CONDACMD = "mamba"
+    EXTRACTION_COST = 50
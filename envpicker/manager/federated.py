@@ -0,0 +1,109 @@
+from __future__ import annotations
+from typing import Optional
+import os
+
+from .base import BaseEnvManager, EnvironmentEntry, path_hash
+from ..logger import ENVPICKER_LOGGER
+
+
+def _available_backends(path: Optional[str]) -> list[BaseEnvManager]:
+    from . import PREFERENCE_ORDER, _MANAGER_CLASSES
+
+    backends = []
+    for name in PREFERENCE_ORDER:
+        cls = _MANAGER_CLASSES.get(name)
+        if cls is None or cls is FederatedManager:
+            continue
+        if cls.is_available():
+            backends.append(cls(path=path))
+    return backends
+
+
+class FederatedManager(BaseEnvManager):
+    """
+    Spans all available managers (e.g. conda and mamba) with a single registry.
+
+    Environments are deduplicated by their normalized path hash, so an environment that
+    is visible to several backends is exported and stored only once. The dependencies of
+    an environment are extracted with the cheapest backend (see EXTRACTION_COST) that
+    handles it, and find_matching covers the environments of all backends.
+
+    The backends are only used to list environments and to extract dependencies,
+    the registry is owned by the federated manager.
+    """
+
+    def __init__(
+        self,
+        path: Optional[str] = None,
+        backends: Optional[list[BaseEnvManager]] = None,
+        **kwargs,
+    ) -> None:
+        super().__init__(path, **kwargs)
+        if backends is None:
+            backends = _available_backends(self.path)
+        # cheapest first
+        self.backends = sorted(backends, key=lambda b: b.EXTRACTION_COST)
+
+    @classmethod
+    def is_available(cls) -> bool:
+        from . import _MANAGER_CLASSES
+
+        return any(
+            c.is_available()
+            for c in _MANAGER_CLASSES.values()
+            if c is not None and c is not cls
+        )
+
+    def watch_dirs(self) -> list[str]:
+        dirs = []
+        for backend in self.backends:
+            for d in backend.watch_dirs():
+                if d not in dirs:
+                    dirs.append(d)
+        return dirs
+
+    def list_env_paths(self) -> list[str]:
+        paths: dict[str, str] = {}
+        for backend in self.backends:
+            try:
+                env_paths = backend.list_env_paths()
+            except NotImplementedError:
+                continue
+            except Exception as exc:
+                ENVPICKER_LOGGER.warning(
+                    "Listing environments with %s failed: %s",
+                    type(backend).__name__,
+                    exc,
+                )
+                continue
+            for env_path in env_paths:
+                env_path = os.path.normpath(os.path.abspath(env_path))
+                paths.setdefault(path_hash(env_path), env_path)
+        return list(paths.values())
+
+    def register_all(self) -> None:
+        """Register all environments of all backends."""
+        self.register_paths(self.list_env_paths())
+
+    def handles_env(self, env: EnvironmentEntry) -> bool:
+        return any(backend.handles_env(env) for backend in self.backends)
+
+    def get_dependencies(self, env: EnvironmentEntry) -> list[str]:
+        errors = []
+        for backend in self.backends:
+            if not backend.handles_env(env):
+                continue
+            try:
+                return backend.get_dependencies(env)
+            except Exception as exc:
+                # fall back to the next (more expensive) backend
+                ENVPICKER_LOGGER.debug(
+                    "%s failed to extract %s: %s",
+                    type(backend).__name__,
+                    env["path"],
+                    exc,
+                )
+                errors.append(exc)
+        if errors:
+            raise errors[-1]
+        raise ValueError(f"No backend handles the environment {env['path']}")
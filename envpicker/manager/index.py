@@ -0,0 +1,141 @@
+from __future__ import annotations
+from typing import Optional, TYPE_CHECKING
+import os
+import json
+import mmap
+import tempfile
+
+if TYPE_CHECKING:
+    from .base import BaseEnvManager, EnvironmentEntry, EnvYaml
+
+INDEX_MAGIC = b"ENVPICKER-INDEX 1\n"
+
+_ENTRY_KEYS = ("hash", "path", "name", "py_executable")
+
+
+def publish_index(manager: BaseEnvManager, target: str) -> str:
+    """
+    Write the environments, their package data and their importable modules
+    to a read-only index file, e.g. on shared storage. The file is replaced atomically,
+    so readers never see a partially written index.
+
+    Layout: the magic line, one json line with the environments and the offsets of their
+    package data (relative to the start of the data section) and of the module blob,
+    followed by the package data of all environments as json blobs and the module blob,
+    which maps the environment hashes to their modules and distributions.
+    """
+    from .base import NO_MODULES_KEY
+
+    target = os.path.abspath(target)
+    env_modules: dict[str, dict[str, str]] = {}
+    for module, providers in (manager._indexed_modules().get() or {}).items():
+        for env_hash, dist in (providers or {}).items():
+            modules = env_modules.setdefault(env_hash, {})
+            if module != NO_MODULES_KEY:
+                modules[module] = dist
+
+    header = []
+    blobs = []
+    offset = 0
+    envs = manager.environments
+    for env in envs:
+        envdata = manager.env_to_full_env(env)["envdata"]
+        blob = json.dumps(envdata, separators=(",", ":")).encode()
+        entry = {k: env[k] for k in _ENTRY_KEYS}
+        entry["offset"] = offset
+        entry["length"] = len(blob)
+        header.append(entry)
+        blobs.append(blob)
+        offset += len(blob)
+    blob = json.dumps(
+        {env["hash"]: env_modules.get(env["hash"], {}) for env in envs},
+        separators=(",", ":"),
+    ).encode()
+    modules_entry = {"offset": offset, "length": len(blob)}
+    blobs.append(blob)
+
+    fd, tmp_path = tempfile.mkstemp(
+        dir=os.path.dirname(target), prefix=".envpicker-index-"
+    )
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(INDEX_MAGIC)
+            f.write(
+                json.dumps({"environments": header, "modules": modules_entry}).encode()
+            )
+            f.write(b"\n")
+            for blob in blobs:
+                f.write(blob)
+        os.chmod(tmp_path, 0o644)
+        os.replace(tmp_path, target)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    return target
+
+
+class SharedIndex:
+    """
+    Read-only, memory-mapped view of an index written by publish_index.
+    Only the environment table is parsed on load, the package data of an environment
+    and the module blob are decoded from the mapped file when they are requested.
+    """
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        with open(path, "rb") as f:
+            self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if self._mm[: len(INDEX_MAGIC)] != INDEX_MAGIC:
+            self._mm.close()
+            raise ValueError(f"{path} is not an envpicker index")
+        header_end = self._mm.find(b"\n", len(INDEX_MAGIC))
+        if header_end < 0:
+            self._mm.close()
+            raise ValueError(f"{path} is not an envpicker index")
+        header = json.loads(self._mm[len(INDEX_MAGIC) : header_end])
+        self._data_start = header_end + 1
+        self._entries: dict[str, dict] = {
+            entry["hash"]: entry for entry in header["environments"]
+        }
+        # missing in indexes published by older versions
+        self._modules_entry: Optional[dict] = header.get("modules")
+        self._modules: Optional[dict[str, dict[str, str]]] = None
+
+    def __contains__(self, env_hash: str) -> bool:
+        return env_hash in self._entries
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, env_hash: str) -> Optional[EnvironmentEntry]:
+        entry = self._entries.get(env_hash)
+        if entry is None:
+            return None
+        return {k: entry[k] for k in _ENTRY_KEYS}
+
+    @property
+    def environments(self) -> list[EnvironmentEntry]:
+        return [{k: entry[k] for k in _ENTRY_KEYS} for entry in self._entries.values()]
+
+    def envdata(self, env_hash: str) -> EnvYaml:
+        entry = self._entries[env_hash]
+        start = self._data_start + entry["offset"]
+        return json.loads(self._mm[start : start + entry["length"]])
+
+    def modules(self, env_hash: str) -> Optional[dict[str, str]]:
+        """
+        Return the top-level modules of the environment mapped to their distributions,
+        None if the index was published without modules.
+        """
+        if self._modules_entry is None:
+            return None
+        if self._modules is None:
+            start = self._data_start + self._modules_entry["offset"]
+            self._modules = json.loads(
+                self._mm[start : start + self._modules_entry["length"]]
+            )
+        return self._modules.get(env_hash)
+
+    def close(self) -> None:
+        self._mm.close()
@@ -0,0 +1,132 @@
+from __future__ import annotations
+from typing import Optional, Union, IO, Tuple
+import os
+from collections import deque
+
+Sink = Union[int, str, "os.PathLike[str]", IO[bytes]]
+
+DEFAULT_TAIL_SIZE = 64 * 1024
+DEFAULT_MAX_LINE = 1024 * 1024
+
+
+class TailBuffer:
+    """
+    Bounded ring buffer, that only keeps the last maxbytes bytes written to it.
+    """
+
+    def __init__(self, maxbytes: int = DEFAULT_TAIL_SIZE) -> None:
+        self.maxbytes = maxbytes
+        self._chunks: deque[bytes] = deque()
+        self._size = 0
+
+    def write(self, data: bytes) -> None:
+        if not data or self.maxbytes <= 0:
+            return
+        if len(data) >= self.maxbytes:
+            self._chunks.clear()
+            data = data[-self.maxbytes :]
+            self._size = 0
+        self._chunks.append(data)
+        self._size += len(data)
+        while self._size - len(self._chunks[0]) >= self.maxbytes:
+            self._size -= len(self._chunks.popleft())
+
+    def getvalue(self) -> bytes:
+        return b"".join(self._chunks)[-self.maxbytes :] if self.maxbytes > 0 else b""
+
+    def __len__(self) -> int:
+        return min(self._size, max(self.maxbytes, 0))
+
+
+class LineFramer:
+    """
+    Reassembles chunks of a stream into complete lines.
+    Lines longer than max_line are split, so a stream without newlines
+    can not grow the buffer without bounds.
+    """
+
+    def __init__(self, max_line: int = DEFAULT_MAX_LINE) -> None:
+        self.max_line = max_line
+        self._partial = b""
+
+    def feed(self, data: bytes) -> list[bytes]:
+        data = self._partial + data
+        end = data.rfind(b"\n")
+        if end < 0:
+            lines = []
+            self._partial = data
+        else:
+            lines = [line + b"\n" for line in data[:end].split(b"\n")]
+            self._partial = data[end + 1 :]
+        while len(self._partial) > self.max_line:
+            lines.append(self._partial[: self.max_line])
+            self._partial = self._partial[self.max_line :]
+        return lines
+
+    def flush(self) -> Optional[bytes]:
+        partial, self._partial = self._partial, b""
+        return partial or None
+
+
+def open_sink(sink: Sink) -> Tuple[Union[int, IO[bytes]], Optional[IO[bytes]]]:
+    """
+    Returns the value to pass to Popen for the sink, the child writes to it directly.
+    Paths are opened for writing, the opened file is returned as second value
+    and has to be closed by the caller.
+    """
+    if isinstance(sink, int):
+        return sink, None
+    if isinstance(sink, (str, os.PathLike)):
+        f = open(sink, "wb")
+        return f, f
+    # data buffered by python would otherwise end up after the output of the child
+    sink.flush()
+    return sink, None
+
+
+def read_sink_tail(sink: Sink, maxbytes: int = DEFAULT_TAIL_SIZE) -> bytes:
+    """
+    Returns the last maxbytes bytes written to the sink, if the sink is a regular file
+    that can be read (otherwise empty bytes).
+    """
+    path = None
+    if isinstance(sink, (str, os.PathLike)):
+        path = sink
+    elif not isinstance(sink, int) and isinstance(getattr(sink, "name", None), str):
+        path = sink.name
+    if path is None or maxbytes <= 0:
+        return b""
+    try:
+        with open(path, "rb") as f:
+            f.seek(0, os.SEEK_END)
+            size = f.tell()
+            f.seek(max(0, size - maxbytes))
+            return f.read()
+    except OSError:
+        return b""
+
+
+class OutputPipeline:
+    """
+    Configures how the output of a run is delivered.
+
+    - lines: yield complete lines instead of raw chunks
+    - stdout/stderr: file descriptor, path or binary file the process writes to directly,
+      the output of such a stream is not yielded
+    - tail_size: number of trailing stderr bytes kept for error reporting
+    - max_line: lines longer than this are split in lines mode
+    """
+
+    def __init__(
+        self,
+        lines: bool = False,
+        stdout: Optional[Sink] = None,
+        stderr: Optional[Sink] = None,
+        tail_size: int = DEFAULT_TAIL_SIZE,
+        max_line: int = DEFAULT_MAX_LINE,
+    ) -> None:
+        self.lines = lines
+        self.stdout = stdout
+        self.stderr = stderr
+        self.tail_size = tail_size
+        self.max_line = max_line
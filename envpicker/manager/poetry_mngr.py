@@ -0,0 +1,186 @@
+from __future__ import annotations
+from typing import Optional
+import os
+import re
+
+try:
+    import tomllib
+except ImportError:  # python < 3.11
+    try:
+        import tomli as tomllib
+    except ImportError:
+        tomllib = None
+
+from .base import BaseEnvManager, EnvironmentEntry, path_hash
+from ..logger import ENVPICKER_LOGGER
+
+POETRY_ROOTS_ENV = "ENVPICKER_POETRY_ROOTS"
+
+# directories that never contain poetry projects worth indexing
+_SKIP_DIRS = {
+    ".git",
+    ".hg",
+    ".venv",
+    "venv",
+    "node_modules",
+    "__pycache__",
+    ".tox",
+    ".nox",
+    ".mypy_cache",
+    ".pytest_cache",
+}
+
+
+def read_lock_packages(lock_path: str) -> list[tuple[str, str]]:
+    """
+    Return name and version of all packages resolved in a poetry.lock.
+    Without a toml parser only the name and version keys of the [[package]] tables are read.
+    """
+    if tomllib is not None:
+        with open(lock_path, "rb") as f:
+            data = tomllib.load(f)
+        return [(p["name"], p["version"]) for p in data.get("package", [])]
+
+    packages = []
+    current: Optional[dict] = None
+    with open(lock_path, "r") as f:
+        for line in f:
+            line = line.strip()
+            if line.startswith("["):
+                if current is not None and "name" in current and "version" in current:
+                    packages.append((current["name"], current["version"]))
+                current = {} if line == "[[package]]" else None
+                continue
+            if current is None:
+                continue
+            match = re.match(r'(name|version)\s*=\s*"([^"]*)"', line)
+            if match:
+                current.setdefault(match.group(1), match.group(2))
+    if current is not None and "name" in current and "version" in current:
+        packages.append((current["name"], current["version"]))
+    return packages
+
+
+def venv_python(venv: str) -> Optional[str]:
+    """
+    Return the interpreter of the virtual environment, if it exists.
+    """
+    for candidate in (
+        os.path.join(venv, "bin", "python"),
+        os.path.join(venv, "Scripts", "python.exe"),
+    ):
+        if os.path.isfile(candidate):
+            return candidate
+    return None
+
+
+def venv_python_version(venv: str) -> Optional[str]:
+    """
+    Return the python version recorded in the pyvenv.cfg of the virtual environment.
+    virtualenv (used by poetry) writes e.g. "version_info = 3.11.7.final.0",
+    only the leading X.Y.Z is returned.
+    """
+    try:
+        with open(os.path.join(venv, "pyvenv.cfg"), "r") as f:
+            for line in f:
+                key, _, value = line.partition("=")
+                if key.strip() in ("version", "version_info"):
+                    match = re.match(r"\d+(?:\.\d+){0,2}", value.strip())
+                    if match:
+                        return match.group(0)
+    except OSError:
+        pass
+    return None
+
+
+def find_poetry_projects(roots: list[str]) -> list[str]:
+    """
+    Return the directories below roots that contain a poetry project
+    (pyproject.toml and poetry.lock) with an in-project .venv.
+    """
+    projects = []
+    for root in roots:
+        for dirpath, dirnames, filenames in os.walk(root):
+            dirnames[:] = [d for d in dirnames if d not in _SKIP_DIRS]
+            if (
+                "poetry.lock" in filenames
+                and "pyproject.toml" in filenames
+                and os.path.isdir(os.path.join(dirpath, ".venv"))
+            ):
+                projects.append(os.path.normpath(os.path.abspath(dirpath)))
+    return projects
+
+
+class PoetryManager(BaseEnvManager):
+    """
+    Indexes the in-project virtual environments (.venv) of poetry projects below roots
+    (defaults to $ENVPICKER_POETRY_ROOTS, separated by os.pathsep).
+    The dependencies are read from poetry.lock, poetry itself is never called.
+    """
+
+    # reading a lockfile is much cheaper than exporting an environment
+    EXTRACTION_COST = 1
+
+    def __init__(
+        self, path: Optional[str] = None, roots: Optional[list[str]] = None, **kwargs
+    ) -> None:
+        super().__init__(path, **kwargs)
+        if roots is None:
+            roots = [r for r in os.environ.get(POETRY_ROOTS_ENV, "").split(os.pathsep) if r]
+        self.roots = roots
+
+    @classmethod
+    def is_available(cls) -> bool:
+        # only the lockfiles are read, so no poetry installation is required,
+        # but without configured roots there is nothing to index
+        return any(r for r in os.environ.get(POETRY_ROOTS_ENV, "").split(os.pathsep))
+
+    def handles_env(self, env: EnvironmentEntry) -> bool:
+        return os.path.isfile(os.path.join(os.path.dirname(env["path"]), "poetry.lock"))
+
+    def list_env_paths(self) -> list[str]:
+        return [
+            os.path.join(project, ".venv")
+            for project in find_poetry_projects(self.roots)
+        ]
+
+    def register_all(self) -> None:
+        """
+        Register the environments of all projects at once,
+        with a single registry write and without probing the interpreters.
+        """
+        with self.registry_lock:
+            envs = self.environments
+            registered = {env["path"] for env in envs}
+            new_envs = []
+            for venv in self.list_env_paths():
+                if venv in registered:
+                    continue
+                py_executable = venv_python(venv)
+                if py_executable is None:
+                    ENVPICKER_LOGGER.debug("No interpreter found in %s", venv)
+                    continue
+                new_envs.append(
+                    EnvironmentEntry(
+                        path=venv,
+                        hash=path_hash(path=venv),
+                        name=os.path.basename(os.path.dirname(venv)),
+                        py_executable=py_executable,
+                    )
+                )
+            if not new_envs:
+                return
+            self.environments = envs + new_envs
+            for env in new_envs:
+                self.create_env_yaml(env, save=False)
+            self.registry.save()
+            self.module_index.save()
+        ENVPICKER_LOGGER.info("Successfully registered %s environments.", len(new_envs))
+
+    def get_dependencies(self, env: EnvironmentEntry) -> list[str]:
+        lock_path = os.path.join(os.path.dirname(env["path"]), "poetry.lock")
+        deps = [f"{name}=={version}" for name, version in read_lock_packages(lock_path)]
+        python_version = venv_python_version(env["path"])
+        if python_version:
+            deps.append(f"python=={python_version}")
+        return deps
@@ -0,0 +1,137 @@
+from __future__ import annotations
+from typing import Optional, Tuple
+import os
+import json
+import base64
+import hashlib
+import tempfile
+import threading
+
+from ..logger import ENVPICKER_LOGGER
+from ..utils import env_signature
+
+DEFAULT_PROBE_CACHE_SIZE = 16 * 1024 * 1024
+
+
+def _signature(env_path: str) -> Optional[list]:
+    sig = env_signature(env_path)
+    return None if sig is None else [list(s) for s in sig]
+
+
+class ProbeCache:
+    """
+    On-disk cache for the output of deterministic probe commands
+    (e.g. "import torch; print(torch.__version__)").
+
+    Entries are keyed on the environment hash, the fingerprint of its package set and
+    the command. An entry also records the stat signature of the environment
+    (conda-meta/history and site-packages, see utils.env_signature) and is dropped
+    as soon as the environment changed. The cache is bounded by max_bytes,
+    the least recently used entries are evicted first.
+    """
+
+    def __init__(self, path: str, max_bytes: int = DEFAULT_PROBE_CACHE_SIZE) -> None:
+        if max_bytes < 1:
+            raise ValueError("max_bytes must be at least 1")
+        os.makedirs(path, exist_ok=True)
+        self.path = path
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def key(env_hash: str, fingerprint: Optional[str], command: str) -> str:
+        return hashlib.sha256(
+            "\0".join((env_hash, fingerprint or "", command)).encode()
+        ).hexdigest()
+
+    def _entry_path(self, key: str) -> str:
+        return os.path.join(self.path, f"{key}.json")
+
+    def get(self, key: str, env_path: str) -> Optional[list[Tuple[bytes, bytes]]]:
+        """
+        Return the recorded output chunks of the entry,
+        None if there is no valid entry.
+        """
+        entry_path = self._entry_path(key)
+        try:
+            with open(entry_path, "r") as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if entry.get("signature") != _signature(env_path):
+            ENVPICKER_LOGGER.debug("Probe cache entry %s is outdated", key)
+            self._remove(entry_path)
+            return None
+        try:
+            # the mtime tracks the last use for the lru eviction
+            os.utime(entry_path)
+        except OSError:
+            pass
+        return [
+            (base64.b64decode(out), base64.b64decode(err))
+            for out, err in entry["chunks"]
+        ]
+
+    def put(
+        self, key: str, env_path: str, chunks: list[Tuple[bytes, bytes]]
+    ) -> bool:
+        """
+        Store the output chunks of a probe, returns False if they exceed the cache size.
+        """
+        data = json.dumps(
+            {
+                "signature": _signature(env_path),
+                "chunks": [
+                    [base64.b64encode(out).decode(), base64.b64encode(err).decode()]
+                    for out, err in chunks
+                ],
+            }
+        ).encode()
+        if len(data) > self.max_bytes:
+            return False
+        fd, tmp_path = tempfile.mkstemp(dir=self.path, prefix=".probe-")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+            os.replace(tmp_path, self._entry_path(key))
+        except BaseException:
+            self._remove(tmp_path)
+            raise
+        self.evict()
+        return True
+
+    def evict(self) -> None:
+        """
+        Remove the least recently used entries until the cache fits into max_bytes.
+        """
+        with self._lock:
+            entries = []
+            total = 0
+            for filename in os.listdir(self.path):
+                if not filename.endswith(".json"):
+                    continue
+                entry_path = os.path.join(self.path, filename)
+                try:
+                    st = os.stat(entry_path)
+                except OSError:
+                    continue
+                entries.append((st.st_mtime_ns, st.st_size, entry_path))
+                total += st.st_size
+            entries.sort()
+            for _, size, entry_path in entries:
+                if total <= self.max_bytes:
+                    break
+                self._remove(entry_path)
+                total -= size
+
+    def clear(self) -> None:
+        for filename in os.listdir(self.path):
+            if filename.endswith(".json"):
+                self._remove(os.path.join(self.path, filename))
+
+    @staticmethod
+    def _remove(path: str) -> None:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
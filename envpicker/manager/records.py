@@ -0,0 +1,124 @@
+"""
+Compact in-memory representation of the registered package data.
+
+The public api works with dicts (EnvironmentEntry, FullEnvironmentEntry,
+PackageVersionCondition). For large registries the managers keep the package data
+in slotted records instead, with interned package names and version objects that are
+shared between all environments, so the same version string is parsed only once.
+"""
+from __future__ import annotations
+from typing import Optional, Union
+import sys
+from packaging.version import Version, InvalidVersion
+from packaging.specifiers import SpecifierSet
+
+from ..utils import split_version, normalize_name
+
+# package name -> interned normalized name (PEP 503)
+_NAMES: dict[str, str] = {}
+# version string -> parsed version (or the stripped string if it is no valid version)
+_VERSIONS: dict[str, Union[Version, str]] = {}
+_SPECIFIERS: dict[str, SpecifierSet] = {}
+
+
+def shared_name(name: str) -> str:
+    """
+    Return the normalized package name, such that e.g. "typing_extensions"
+    and "typing-extensions" are the same package.
+    """
+    normalized = _NAMES.get(name)
+    if normalized is None:
+        normalized = sys.intern(normalize_name(name))
+        _NAMES[name] = normalized
+    return normalized
+
+
+def shared_version(vstring: str) -> Union[Version, str]:
+    """
+    Return the version object for the version part of a package entry (e.g. "=1.19.0"),
+    the same object is returned for equal version strings.
+    """
+    version = _VERSIONS.get(vstring)
+    if version is None:
+        current = vstring.strip()
+        while current.startswith("="):
+            current = current[1:]
+        try:
+            version = Version(current)
+        except InvalidVersion:
+            version = sys.intern(current)
+        _VERSIONS[vstring] = version
+    return version
+
+
+def shared_specifier(vstring: str) -> SpecifierSet:
+    spec = _SPECIFIERS.get(vstring)
+    if spec is None:
+        lookup = vstring.strip()
+        if not lookup:
+            raise ValueError("Lookup version cannot be empty")
+        spec = SpecifierSet(lookup)
+        _SPECIFIERS[vstring] = spec
+    return spec
+
+
+class PackageRecord:
+    __slots__ = ("name", "vstring", "version")
+
+    def __init__(self, name: str, vstring: str) -> None:
+        self.name = shared_name(name)
+        self.vstring = sys.intern(vstring)
+        self.version = shared_version(vstring)
+
+    def matches(self, requirement: Requirement) -> bool:
+        if isinstance(self.version, str) and not self.version:
+            raise ValueError("Current version cannot be empty")
+        return requirement.spec.contains(self.version)
+
+    def __repr__(self) -> str:
+        return f"PackageRecord({self.name!r}, {self.vstring!r})"
+
+
+class Requirement:
+    __slots__ = ("entry", "name", "spec")
+
+    def __init__(self, entry: str) -> None:
+        cond = split_version(entry)
+        self.entry = entry
+        self.name = shared_name(cond["pkg"])
+        self.spec = shared_specifier(cond["vstring"])
+
+    def is_met(self, packages: dict[str, PackageRecord]) -> bool:
+        record = packages.get(self.name)
+        return record is not None and record.matches(self)
+
+
+class EnvRecord:
+    """
+    Package data of an environment, stamp identifies the snapshot it was built from.
+    """
+
+    __slots__ = ("hash", "packages", "stamp")
+
+    def __init__(
+        self, env_hash: str, dependencies: list[str], stamp: Optional[tuple] = None
+    ) -> None:
+        self.hash = env_hash
+        self.stamp = stamp
+        packages = {}
+        for dep in dependencies:
+            cond = split_version(dep)
+            record = PackageRecord(cond["pkg"], cond["vstring"])
+            packages[record.name] = record
+        self.packages: dict[str, PackageRecord] = packages
+
+    def unmet(
+        self, requirements: list[Requirement], first_only: bool = False
+    ) -> list[Requirement]:
+        unmet = []
+        for requirement in requirements:
+            if not requirement.is_met(self.packages):
+                unmet.append(requirement)
+                if first_only:
+                    break
+        return unmet
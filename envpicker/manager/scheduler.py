@@ -0,0 +1,150 @@
+from __future__ import annotations
+from typing import Optional, TypedDict, Generator
+import os
+import time
+import signal
+import subprocess
+import threading
+from contextlib import contextmanager
+
+from ..logger import ENVPICKER_LOGGER
+
+
+class RunReport(TypedDict):
+    returncode: Optional[int]
+    queue_wait: float
+    # wall time from the start of the process until it exited, excluding the time
+    # the output generator was suspended after that
+    run_time: float
+    # seconds from the start of the process until its first output
+    time_to_first_output: Optional[float]
+    # resource usage of the process, None where os.wait4 is not available
+    user_cpu: Optional[float]
+    sys_cpu: Optional[float]
+    # peak resident set size in bytes
+    max_rss: Optional[int]
+
+
+def empty_run_report() -> RunReport:
+    return RunReport(
+        returncode=None,
+        queue_wait=0.0,
+        run_time=0.0,
+        time_to_first_output=None,
+        user_cpu=None,
+        sys_cpu=None,
+        max_rss=None,
+    )
+
+
+def popen_in_group(args: list[str], **kwargs) -> subprocess.Popen:
+    """
+    Starts the process in its own process group (a new session on posix),
+    such that it can be killed together with all of its children.
+    """
+    if os.name == "nt":
+        kwargs["creationflags"] = (
+            kwargs.get("creationflags", 0) | subprocess.CREATE_NEW_PROCESS_GROUP
+        )
+    else:
+        kwargs["start_new_session"] = True
+    return subprocess.Popen(args, **kwargs)
+
+
+def kill_process_group(proc: subprocess.Popen) -> None:
+    """
+    Kills the process group started by popen_in_group, including grandchildren
+    that outlived the process itself.
+    """
+    if os.name == "nt":
+        if proc.poll() is None:
+            try:
+                subprocess.call(
+                    ["taskkill", "/F", "/T", "/PID", str(proc.pid)],
+                    stdout=subprocess.DEVNULL,
+                    stderr=subprocess.DEVNULL,
+                )
+            except OSError:
+                proc.kill()
+        return
+    try:
+        os.killpg(proc.pid, signal.SIGKILL)
+    except (ProcessLookupError, PermissionError):
+        pass
+
+
+class RunScheduler:
+    """
+    Limits the number of concurrently running processes, globally and per environment.
+    A limit of None means unlimited.
+    """
+
+    def __init__(
+        self, max_parallel: Optional[int] = None, max_per_env: Optional[int] = None
+    ) -> None:
+        if max_parallel is not None and max_parallel < 1:
+            raise ValueError("max_parallel must be at least 1")
+        if max_per_env is not None and max_per_env < 1:
+            raise ValueError("max_per_env must be at least 1")
+        self.max_parallel = max_parallel
+        self.max_per_env = max_per_env
+        self._global = (
+            threading.BoundedSemaphore(max_parallel) if max_parallel else None
+        )
+        self._per_env: dict[str, threading.BoundedSemaphore] = {}
+        self._lock = threading.Lock()
+        self._running = 0
+        self._waiting = 0
+
+    def _env_semaphore(self, env_hash: str) -> Optional[threading.BoundedSemaphore]:
+        if not self.max_per_env:
+            return None
+        with self._lock:
+            if env_hash not in self._per_env:
+                self._per_env[env_hash] = threading.BoundedSemaphore(self.max_per_env)
+            return self._per_env[env_hash]
+
+    @property
+    def running(self) -> int:
+        return self._running
+
+    @property
+    def waiting(self) -> int:
+        return self._waiting
+
+    @contextmanager
+    def slot(self, env_hash: str) -> Generator[float, None, None]:
+        """
+        Blocks until a run in the given environment may start,
+        yields the time spent waiting in the queue.
+        """
+        queued = time.perf_counter()
+        env_sem = self._env_semaphore(env_hash)
+        with self._lock:
+            self._waiting += 1
+        acquired = []
+        try:
+            # the per environment slot is taken first,
+            # so a run waiting for its environment does not block a global slot
+            for sem in (env_sem, self._global):
+                if sem is not None:
+                    sem.acquire()
+                    acquired.append(sem)
+        except BaseException:
+            for sem in reversed(acquired):
+                sem.release()
+            with self._lock:
+                self._waiting -= 1
+            raise
+        queue_wait = time.perf_counter() - queued
+        with self._lock:
+            self._waiting -= 1
+            self._running += 1
+        ENVPICKER_LOGGER.debug("Run in %s started after %.3fs", env_hash, queue_wait)
+        try:
+            yield queue_wait
+        finally:
+            with self._lock:
+                self._running -= 1
+            for sem in reversed(acquired):
+                sem.release()
@@ -1,6 +1,12 @@
-from typing import List, Dict, Any, TypedDict
+from typing import List, Dict, Any, TypedDict, Optional, Tuple, Union
+import os
 import re
+import glob
+import ast
+import sys
+import hashlib
 from packaging.specifiers import SpecifierSet
+from packaging.utils import canonicalize_version
 
 
 class PackageVersionCondition(TypedDict):
@@ -82,3 +88,273 @@ def matches_version(lookup: str, current: str) -> bool:
     specifier_req = SpecifierSet(lookup)
 
     return specifier_req.contains(current)
+
+
+def site_packages_dirs(env_path: str) -> List[str]:
+    """
+    Return the site-packages directories of the environment at env_path.
+
+    Covers the posix layout (lib/pythonX.Y/site-packages) as well as the
+    windows layout (Lib/site-packages).
+    """
+    candidates = glob.glob(
+        os.path.join(env_path, "lib", "python*", "site-packages")
+    ) + [os.path.join(env_path, "Lib", "site-packages")]
+    return sorted(set(c for c in candidates if os.path.isdir(c)))
+
+
+def env_signature(env_path: str) -> Optional[tuple]:
+    """
+    Return a cheap stat based signature of the environment, that changes
+    whenever conda-meta/history or a site-packages directory changes.
+    Returns None if the environment does not exist.
+    """
+    if not os.path.isdir(env_path):
+        return None
+    sig = []
+    for p in [os.path.join(env_path, "conda-meta", "history")] + site_packages_dirs(
+        env_path
+    ):
+        try:
+            sig.append((p, os.stat(p).st_mtime_ns))
+        except OSError:
+            sig.append((p, None))
+    return tuple(sig)
+
+
+def normalize_name(name: str) -> str:
+    """
+    Normalize a package name (PEP 503), such that e.g. "PyYAML" and "pyyaml" are equal.
+    """
+    return re.sub(r"[-_.]+", "-", name).lower()
+
+
+def exact_pin(entry: str) -> Optional[Tuple[str, str]]:
+    """
+    Return the normalized name and the version if the entry pins exactly one version
+    ("numpy==1.19.0" or conda style "numpy=1.19.0"), otherwise None.
+    """
+    match = re.fullmatch(r"([^<>=!~\s]+)(==|=)([^<>=!,*\s]+)(=[^<>=!,*\s]+)?", entry.strip())
+    if match is None:
+        return None
+    # a trailing "=build" of conda entries is not part of the version
+    return normalize_name(match.group(1)), match.group(3)
+
+
+def package_fingerprint(entries: List[str]) -> str:
+    """
+    Return the content fingerprint of the exactly pinned entries of a package set,
+    independent of their order, duplicates, pin style and version spelling
+    (e.g. "1.19" and "1.19.0").
+    """
+    pins = set()
+    for entry in entries:
+        pin = exact_pin(entry)
+        if pin is not None:
+            pins.add(f"{pin[0]}=={canonicalize_version(pin[1])}")
+    return hashlib.sha256("\n".join(sorted(pins)).encode()).hexdigest()
+
+
+def read_lock_entries(source: Union[str, List[str]]) -> List[str]:
+    """
+    Return the package entries of a lock.
+
+    source can be a list of entries or the path of a requirements-style lockfile
+    (e.g. pip freeze output, hashes and markers are ignored), a conda environment yaml
+    or a conda explicit spec (conda list --explicit).
+    """
+    if not isinstance(source, str):
+        return [entry.strip() for entry in source if entry and entry.strip()]
+
+    with open(source, "r") as f:
+        content = f.read()
+
+    if source.endswith((".yml", ".yaml")):
+        import yaml
+
+        data = yaml.safe_load(content) or {}
+        entries = []
+        for entry in data.get("dependencies", []):
+            if isinstance(entry, dict):
+                entries.extend(entry.get("pip", []))
+            else:
+                entries.append(entry)
+        return [str(entry).strip() for entry in entries]
+
+    if "@EXPLICIT" in content:
+        entries = []
+        for line in content.splitlines():
+            line = line.strip()
+            if not line or line.startswith(("#", "@")):
+                continue
+            filename = line.split("#", 1)[0].rstrip("/").rsplit("/", 1)[-1]
+            for ext in (".tar.bz2", ".conda"):
+                if filename.endswith(ext):
+                    filename = filename[: -len(ext)]
+            parts = filename.rsplit("-", 2)
+            if len(parts) == 3:
+                entries.append(f"{parts[0]}=={parts[1]}")
+        return entries
+
+    entries = []
+    for line in content.splitlines():
+        line = line.split(" #", 1)[0].strip()
+        if not line or line.startswith(("#", "-")):
+            continue
+        # environment markers, hashes and line continuations
+        line = line.split(";", 1)[0].split(" ", 1)[0].rstrip("\\").strip()
+        if line:
+            entries.append(line)
+    return entries
+
+
+_STDLIB_MODULES: Optional[frozenset] = None
+
+
+def stdlib_modules() -> frozenset:
+    """
+    Return the names of the top-level modules of the standard library.
+    Python < 3.10 does not provide sys.stdlib_module_names, there the list is built
+    from the builtin modules and the contents of the stdlib directory.
+    """
+    global _STDLIB_MODULES
+    if _STDLIB_MODULES is not None:
+        return _STDLIB_MODULES
+    names = getattr(sys, "stdlib_module_names", None)
+    if names is None:
+        import sysconfig
+
+        names = set(sys.builtin_module_names)
+        stdlib = sysconfig.get_paths()["stdlib"]
+        for directory in (
+            stdlib,
+            os.path.join(stdlib, "lib-dynload"),
+            os.path.join(sys.base_prefix, "DLLs"),
+        ):
+            try:
+                entries = os.listdir(directory)
+            except OSError:
+                continue
+            for entry in entries:
+                if entry.endswith((".py", ".so", ".pyd")) or os.path.isfile(
+                    os.path.join(directory, entry, "__init__.py")
+                ):
+                    names.add(entry.split(".", 1)[0])
+    _STDLIB_MODULES = frozenset(names)
+    return _STDLIB_MODULES
+
+
+def _top_level_from_record(record_path: str) -> List[str]:
+    modules = set()
+    with open(record_path, "r", errors="replace") as f:
+        for line in f:
+            path = line.split(",", 1)[0].strip().replace("\\", "/")
+            if not path or path.startswith(("..", "/")):
+                continue
+            first = path.split("/", 1)[0]
+            if first.endswith((".dist-info", ".egg-info", ".data")) or first in (
+                "__pycache__",
+                "bin",
+                "Scripts",
+            ):
+                continue
+            if "/" in path:
+                modules.add(first)
+            elif first.endswith((".py", ".so", ".pyd")):
+                # e.g. six.py or _cffi_backend.cpython-311-x86_64-linux-gnu.so
+                modules.add(first.split(".", 1)[0])
+    return sorted(modules)
+
+
+def distribution_modules(env_path: str) -> Dict[str, str]:
+    """
+    Return the importable top-level modules of the environment at env_path,
+    mapped to the (normalized) name of the distribution that provides them.
+
+    The modules are read from top_level.txt of the installed distributions,
+    falling back to their RECORD.
+    """
+    modules: Dict[str, str] = {}
+    for site_packages in site_packages_dirs(env_path):
+        try:
+            entries = sorted(os.listdir(site_packages))
+        except OSError:
+            continue
+        for entry in entries:
+            if not entry.endswith((".dist-info", ".egg-info")):
+                continue
+            meta_dir = os.path.join(site_packages, entry)
+            dist = normalize_name(entry.rsplit(".", 1)[0].split("-", 1)[0])
+            top_level_path = os.path.join(meta_dir, "top_level.txt")
+            record_path = os.path.join(meta_dir, "RECORD")
+            try:
+                if os.path.isfile(top_level_path):
+                    with open(top_level_path, "r", errors="replace") as f:
+                        names = [line.strip().split("/", 1)[0] for line in f]
+                elif os.path.isfile(record_path):
+                    names = _top_level_from_record(record_path)
+                else:
+                    continue
+            except OSError:
+                continue
+            for name in names:
+                if name.isidentifier():
+                    modules.setdefault(name, dist)
+    return modules
+
+
+def _catches_import_error(node: ast.Try) -> bool:
+    for handler in node.handlers:
+        if handler.type is None:
+            return True
+        types = (
+            handler.type.elts if isinstance(handler.type, ast.Tuple) else [handler.type]
+        )
+        for t in types:
+            if isinstance(t, ast.Name) and t.id in (
+                "ImportError",
+                "ModuleNotFoundError",
+                "Exception",
+                "BaseException",
+            ):
+                return True
+    return False
+
+
+def script_imports(path: str) -> List[str]:
+    """
+    Return the top-level modules the python script at path requires,
+    i.e. its absolute imports except those guarded by a try/except ImportError,
+    standard library modules and modules that live next to the script.
+    """
+    with open(path, "rb") as f:
+        tree = ast.parse(f.read(), filename=path)
+
+    optional = set()
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Try) and _catches_import_error(node):
+            for stmt in node.body:
+                for child in ast.walk(stmt):
+                    optional.add(id(child))
+
+    modules = set()
+    for node in ast.walk(tree):
+        if id(node) in optional:
+            continue
+        if isinstance(node, ast.Import):
+            modules.update(alias.name.split(".", 1)[0] for alias in node.names)
+        elif isinstance(node, ast.ImportFrom) and node.level == 0 and node.module:
+            modules.add(node.module.split(".", 1)[0])
+
+    stdlib = stdlib_modules()
+    script_dir = os.path.dirname(os.path.abspath(path))
+    required = []
+    for module in sorted(modules):
+        if module in stdlib:
+            continue
+        if os.path.isfile(os.path.join(script_dir, f"{module}.py")) or os.path.isdir(
+            os.path.join(script_dir, module)
+        ):
+            continue
+        required.append(module)
+    return required
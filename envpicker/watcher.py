@@ -0,0 +1,322 @@
+from __future__ import annotations
+from typing import Optional, Iterable, TYPE_CHECKING
+import os
+import sys
+import time
+import struct
+import select
+import threading
+
+from .logger import ENVPICKER_LOGGER
+from .utils import site_packages_dirs, env_signature
+
+if TYPE_CHECKING:
+    from .manager.base import BaseEnvManager
+
+
+# inotify constants, see inotify(7)
+IN_MODIFY = 0x00000002
+IN_ATTRIB = 0x00000004
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_IGNORED = 0x00008000
+IN_ONLYDIR = 0x01000000
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+
+_EVENT_HEADER = struct.Struct("iIII")
+
+# mask for the directories containing environments (e.g. conda envs_dirs)
+_ENVS_DIR_MASK = IN_CREATE | IN_DELETE | IN_MOVED_FROM | IN_MOVED_TO | IN_ONLYDIR
+# mask for the environment root, conda-meta and site-packages directories
+_ENV_MASK = (
+    IN_CREATE
+    | IN_DELETE
+    | IN_MOVED_FROM
+    | IN_MOVED_TO
+    | IN_CLOSE_WRITE
+    | IN_DELETE_SELF
+    | IN_MOVE_SELF
+    | IN_ONLYDIR
+)
+
+
+def is_conda_env(path: str) -> bool:
+    """
+    Return True if the path looks like a conda environment
+    """
+    return os.path.isdir(os.path.join(path, "conda-meta"))
+
+
+class _PollingBackend:
+    """
+    Fallback backend that compares stat signatures of all candidate environments.
+    """
+
+    def __init__(self, watcher: EnvWatcher) -> None:
+        self.watcher = watcher
+        self._snapshot = self._take_snapshot(watcher.candidate_envs())
+
+    @staticmethod
+    def _take_snapshot(envs: Iterable[str]) -> dict[str, Optional[tuple]]:
+        return {env: env_signature(env) for env in envs}
+
+    def rescan(self, envs: set[str]) -> None:
+        self._snapshot = self._take_snapshot(envs)
+
+    def wait(self, timeout: float) -> set[str]:
+        if self.watcher._stop_event.wait(min(timeout, self.watcher.poll_interval)):
+            return set()
+        new_snapshot = self._take_snapshot(self.watcher.candidate_envs())
+        changed = set()
+        for env in set(new_snapshot) | set(self._snapshot):
+            if new_snapshot.get(env) != self._snapshot.get(env):
+                changed.add(env)
+        self._snapshot = new_snapshot
+        return changed
+
+    def close(self) -> None:
+        pass
+
+
+class _InotifyBackend:
+    """
+    Linux backend based on inotify, accessed via ctypes to avoid further dependencies.
+    """
+
+    def __init__(self, watcher: EnvWatcher) -> None:
+        import ctypes
+        import ctypes.util
+
+        self.watcher = watcher
+        self._ctypes = ctypes
+        self._libc = ctypes.CDLL(
+            ctypes.util.find_library("c") or "libc.so.6", use_errno=True
+        )
+        self._fd = self._libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self._fd < 0:
+            errno = ctypes.get_errno()
+            raise OSError(errno, os.strerror(errno))
+        # wd -> (watched directory, environment path or None for envs dirs)
+        self._watches: dict[int, tuple[str, Optional[str]]] = {}
+        self._wds: dict[str, int] = {}
+        self.rescan(watcher.candidate_envs())
+
+    def _add_watch(self, directory: str, env_path: Optional[str], mask: int) -> None:
+        if directory in self._wds or not os.path.isdir(directory):
+            return
+        wd = self._libc.inotify_add_watch(self._fd, os.fsencode(directory), mask)
+        if wd < 0:
+            ENVPICKER_LOGGER.debug(
+                "Could not watch %s: %s",
+                directory,
+                os.strerror(self._ctypes.get_errno()),
+            )
+            return
+        self._watches[wd] = (directory, env_path)
+        self._wds[directory] = wd
+
+    def rescan(self, envs: set[str]) -> None:
+        envs = set(envs)
+        for d in self.watcher.watch_dirs:
+            self._add_watch(d, None, _ENVS_DIR_MASK)
+            # also watch directories that are not (yet) environments,
+            # conda creates conda-meta only after the environment directory
+            try:
+                envs.update(
+                    os.path.join(d, child)
+                    for child in os.listdir(d)
+                    if os.path.isdir(os.path.join(d, child))
+                )
+            except OSError:
+                pass
+        for env in envs:
+            self._add_watch(env, env, _ENV_MASK)
+            self._add_watch(os.path.join(env, "conda-meta"), env, _ENV_MASK)
+            for sp in site_packages_dirs(env):
+                self._add_watch(sp, env, _ENV_MASK)
+
+    def wait(self, timeout: float) -> set[str]:
+        # wake up regularly to check for the stop event
+        readable, _, _ = select.select([self._fd], [], [], min(timeout, 1.0))
+        if not readable:
+            return set()
+        try:
+            data = os.read(self._fd, 64 * 1024)
+        except BlockingIOError:
+            return set()
+
+        changed = set()
+        offset = 0
+        while offset + _EVENT_HEADER.size <= len(data):
+            wd, mask, _, length = _EVENT_HEADER.unpack_from(data, offset)
+            offset += _EVENT_HEADER.size
+            name = data[offset : offset + length].rstrip(b"\0")
+            offset += length
+            if wd not in self._watches:
+                continue
+            directory, env_path = self._watches[wd]
+            if mask & IN_IGNORED:
+                # the watched directory is gone
+                del self._watches[wd]
+                self._wds.pop(directory, None)
+            if env_path is None:
+                if name:
+                    changed.add(os.path.join(directory, os.fsdecode(name)))
+            else:
+                changed.add(env_path)
+        return changed
+
+    def close(self) -> None:
+        if self._fd >= 0:
+            os.close(self._fd)
+            self._fd = -1
+
+
+class EnvWatcher:
+    """
+    Keeps the registry and the package data of a manager live by watching the
+    environments on the filesystem.
+
+    Changes to conda-meta/history or to the site-packages directories of an environment
+    trigger a refresh of its yaml snapshot, new environments in the watched directories
+    are registered and deleted environments are removed. Bursts of events are debounced,
+    such that an environment is only updated once a change has settled.
+
+    On Linux inotify is used, otherwise (or if inotify is not usable)
+    the watcher falls back to polling the stat signatures of the environments.
+    """
+
+    def __init__(
+        self,
+        manager: BaseEnvManager,
+        watch_dirs: Optional[list[str]] = None,
+        debounce: float = 2.0,
+        poll_interval: float = 5.0,
+        backend: Optional[str] = None,
+    ) -> None:
+        if watch_dirs is None:
+            watch_dirs = manager.watch_dirs()
+        if backend not in (None, "inotify", "poll"):
+            raise ValueError(f"Unknown watcher backend {backend}")
+        self.manager = manager
+        self.watch_dirs = [os.path.normpath(os.path.abspath(d)) for d in watch_dirs]
+        self.debounce = debounce
+        self.poll_interval = poll_interval
+        self.backend_name = backend
+        self._backend = None
+        self._thread: Optional[threading.Thread] = None
+        self._stop_event = threading.Event()
+
+    def candidate_envs(self) -> set[str]:
+        """
+        Return the registered environments and all environments in the watched directories.
+        """
+        envs = {env["path"] for env in self.manager.environments}
+        for d in self.watch_dirs:
+            try:
+                children = os.listdir(d)
+            except OSError:
+                continue
+            for child in children:
+                path = os.path.join(d, child)
+                if is_conda_env(path):
+                    envs.add(path)
+        return envs
+
+    def _create_backend(self):
+        if self.backend_name != "poll" and sys.platform.startswith("linux"):
+            try:
+                return _InotifyBackend(self)
+            except (OSError, AttributeError) as exc:
+                if self.backend_name == "inotify":
+                    raise
+                ENVPICKER_LOGGER.debug("inotify not usable, falling back to polling: %s", exc)
+        elif self.backend_name == "inotify":
+            raise OSError("inotify is only available on Linux")
+        return _PollingBackend(self)
+
+    def sync(self, paths: Iterable[str]) -> None:
+        """
+        Bring the registry entries of the given environment paths up to date.
+        """
+        for path in sorted(set(paths)):
+            path = os.path.normpath(os.path.abspath(path))
+            try:
+                # the manager is shared with other threads, the registry must not
+                # change between the lookup and the update
+                with self.manager.registry_lock:
+                    registered = {
+                        env["path"]: env for env in self.manager.environments
+                    }
+                    if path in registered:
+                        if os.path.isdir(path):
+                            ENVPICKER_LOGGER.info("Environment %s changed", path)
+                            self.manager.create_env_yaml(registered[path])
+                        else:
+                            self.manager.remove_env(path)
+                    elif is_conda_env(path):
+                        self.manager.register_environment(
+                            path=path, name=os.path.basename(path)
+                        )
+            except Exception:
+                ENVPICKER_LOGGER.exception("Failed to update environment %s", path)
+
+    def run(self) -> None:
+        """
+        Watch until stop() is called, blocks the calling thread.
+        """
+        self._backend = self._create_backend()
+        ENVPICKER_LOGGER.debug(
+            "Watching environments with %s", type(self._backend).__name__
+        )
+        pending: set[str] = set()
+        last_event = 0.0
+        try:
+            while not self._stop_event.is_set():
+                if pending:
+                    timeout = max(0.0, last_event + self.debounce - time.monotonic())
+                else:
+                    timeout = self.poll_interval
+                changed = self._backend.wait(timeout)
+                if changed:
+                    pending |= changed
+                    last_event = time.monotonic()
+                    continue
+                if pending and time.monotonic() - last_event >= self.debounce:
+                    self.sync(pending)
+                    pending = set()
+                    self._backend.rescan(self.candidate_envs())
+        finally:
+            self._backend.close()
+            self._backend = None
+
+    def start(self) -> EnvWatcher:
+        """
+        Start watching in a background thread.
+        """
+        if self._thread is not None and self._thread.is_alive():
+            return self
+        self._stop_event.clear()
+        self._thread = threading.Thread(
+            target=self.run, name="envpicker-watcher", daemon=True
+        )
+        self._thread.start()
+        return self
+
+    def stop(self, timeout: Optional[float] = None) -> None:
+        self._stop_event.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+
+    def __enter__(self) -> EnvWatcher:
+        return self.start()
+
+    def __exit__(self, *args) -> None:
+        self.stop()
@@ -15,6 +15,7 @@ setup(
     author_email="julian.kimmig@linkdlab.de",
     packages=find_packages(),  # Update with your package name
     install_requires=["pyyaml"],
+    entry_points={"console_scripts": ["envpicker=envpicker.cli:main"]},
     # github
     url="https://github.com/Linkdlab/EnvPicker",
     # license
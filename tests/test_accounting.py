@@ -0,0 +1,161 @@
+import unittest
+import os
+import sys
+import shutil
+import tempfile
+import subprocess
+from unittest.mock import patch
+
+
+class TestProcessReaper(unittest.TestCase):
+    def test_rusage(self):
+        from envpicker.manager.accounting import ProcessReaper, rusage_fields
+
+        command = "x = bytearray(50 * 1024 * 1024); import sys; sys.exit(4)"
+        reaper = ProcessReaper(subprocess.Popen([sys.executable, "-c", command]))
+        returncode, rusage = reaper.wait(timeout=30)
+        self.assertEqual(returncode, 4)
+        self.assertTrue(reaper.done())
+        if not hasattr(os, "wait4"):
+            self.assertIsNone(rusage)
+            return
+        fields = rusage_fields(rusage)
+        self.assertGreater(fields["user_cpu"] + fields["sys_cpu"], 0)
+        self.assertGreaterEqual(fields["max_rss"], 50 * 1024 * 1024)
+
+    def test_timeout(self):
+        from envpicker.manager.accounting import ProcessReaper
+
+        proc = subprocess.Popen([sys.executable, "-c", "import time; time.sleep(10)"])
+        reaper = ProcessReaper(proc)
+        try:
+            with self.assertRaises(subprocess.TimeoutExpired):
+                reaper.wait(timeout=0.1)
+        finally:
+            proc.kill()
+            reaper.wait()
+
+
+class TestResourceLedger(unittest.TestCase):
+    def test_summary(self):
+        from envpicker.manager.accounting import ResourceLedger
+
+        ledger = ResourceLedger()
+        ledger.record(
+            "a",
+            {
+                "returncode": 0,
+                "run_time": 1.0,
+                "user_cpu": 0.5,
+                "sys_cpu": 0.1,
+                "max_rss": 100,
+                "time_to_first_output": 0.2,
+            },
+        )
+        ledger.record(
+            "a",
+            {
+                "returncode": 1,
+                "run_time": 3.0,
+                "user_cpu": 1.5,
+                "sys_cpu": 0.3,
+                "max_rss": 50,
+                "time_to_first_output": None,
+            },
+        )
+        summary = ledger.summary()["a"]
+        self.assertEqual(summary["runs"], 2)
+        self.assertEqual(summary["failed"], 1)
+        self.assertAlmostEqual(summary["wall_time"], 4.0)
+        self.assertAlmostEqual(summary["user_cpu"], 2.0)
+        self.assertAlmostEqual(summary["sys_cpu"], 0.4)
+        self.assertEqual(summary["max_rss"], 100)
+        self.assertAlmostEqual(summary["mean_wall_time"], 2.0)
+        self.assertAlmostEqual(summary["mean_time_to_first_output"], 0.2)
+        ledger.clear()
+        self.assertEqual(ledger.summary(), {})
+
+
+class TestRunAccounting(unittest.TestCase):
+    def setUp(self) -> None:
+        from envpicker.manager.base import BaseEnvManager
+
+        class MockBaseEnvManager(BaseEnvManager):
+            @classmethod
+            def is_available(cls):
+                return True
+
+            @classmethod
+            def register_all(cls):
+                pass
+
+            def get_dependencies(self, env):
+                return []
+
+        self.tempdir = tempfile.mkdtemp()
+        self.manager = MockBaseEnvManager(
+            path=os.path.join(self.tempdir, "registry"), track_resources=True
+        )
+        self.env = {
+            "hash": "hash",
+            "path": self.tempdir,
+            "name": "env",
+            "py_executable": sys.executable,
+        }
+
+    def tearDown(self) -> None:
+        shutil.rmtree(self.tempdir)
+
+    def test_with_report(self):
+        from envpicker.manager.base import BaseEnvManager
+
+        output, report = BaseEnvManager.with_report(
+            BaseEnvManager.run_py_in_env(
+                self.env, "import time; time.sleep(0.2); print('hello')"
+            )
+        )
+        self.assertIsNone(report["returncode"])
+        self.assertIn(b"hello", b"".join(out for out, _ in output))
+        self.assertEqual(report["returncode"], 0)
+        self.assertGreaterEqual(report["time_to_first_output"], 0.2)
+        self.assertGreaterEqual(report["run_time"], report["time_to_first_output"])
+        if hasattr(os, "wait4"):
+            self.assertGreater(report["user_cpu"] + report["sys_cpu"], 0)
+            self.assertGreater(report["max_rss"], 0)
+
+    def test_run_time_excludes_slow_consumer(self):
+        import time
+        from envpicker.manager.base import BaseEnvManager
+
+        output, report = BaseEnvManager.with_report(
+            BaseEnvManager.run_py_in_env(self.env, "print('hello')")
+        )
+        for _ in output:
+            time.sleep(0.5)
+        self.assertEqual(report["returncode"], 0)
+        self.assertLess(report["run_time"], 0.5)
+
+    def test_with_report_failure(self):
+        from envpicker.manager.base import BaseEnvManager, ProcessError
+
+        output, report = BaseEnvManager.with_report(
+            BaseEnvManager.run_py_in_env(self.env, "import sys; sys.exit(2)")
+        )
+        with self.assertRaises(ProcessError) as ctx:
+            list(output)
+        self.assertEqual(ctx.exception.report["returncode"], 2)
+        self.assertEqual(report["returncode"], 2)
+        self.assertIsNone(report["time_to_first_output"])
+
+    def test_ledger(self):
+        from envpicker.manager.base import ProcessError
+
+        with patch.object(self.manager, "first_matching", return_value=self.env):
+            list(self.manager.run_py_in_matching([], "print('hello')"))
+            with self.assertRaises(ProcessError):
+                list(self.manager.run_py_in_matching([], "import sys; sys.exit(1)"))
+        summary = self.manager.resource_ledger.summary()
+        self.assertEqual(list(summary), ["hash"])
+        self.assertEqual(summary["hash"]["runs"], 2)
+        self.assertEqual(summary["hash"]["failed"], 1)
+        self.assertGreater(summary["hash"]["wall_time"], 0)
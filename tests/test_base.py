@@ -183,6 +183,16 @@ class TestBaseEnvManager(unittest.TestCase):
             ),
         )
 
+    def test_remove_env(self):
+        yaml_path = os.path.join(self.manager.path, "mock_hash.yaml")
+        with open(yaml_path, "w") as f:
+            f.write("name: mock_env\ndependencies: []\n")
+        removed = self.manager.remove_env(self.mock_env["path"])
+        self.assertEqual(removed, self.mock_env)
+        self.assertEqual(self.manager.environments, [])
+        self.assertFalse(os.path.exists(yaml_path))
+        self.assertIsNone(self.manager.remove_env(self.mock_env["path"]))
+
     @patch("builtins.open", new_callable=unittest.mock.mock_open)
     def test_create_env_yaml(self, mock_open):
         self.manager.create_env_yaml(self.mock_env)
@@ -209,3 +219,475 @@ class TestFindEnvManager(unittest.TestCase):
 
         with self.assertRaises(RuntimeError):
             mgr = get_manager(preferences=["dummy"])
+
+
+class TestRunInAllMatching(unittest.TestCase):
+    def setUp(self) -> None:
+        from envpicker.manager.base import BaseEnvManager
+
+        class MockBaseEnvManager(BaseEnvManager):
+            @classmethod
+            def is_available(cls):
+                return True
+
+            @classmethod
+            def register_all(cls):
+                pass
+
+            def get_dependencies(self, env):
+                return []
+
+        import sys
+
+        self.tempdir = tempfile.mkdtemp()
+        self.manager = MockBaseEnvManager(path=os.path.join(self.tempdir, "registry"))
+        self.envs = [
+            {
+                "hash": f"hash{i}",
+                "path": self.tempdir,
+                "name": f"env{i}",
+                "py_executable": sys.executable,
+            }
+            for i in range(3)
+        ]
+        self.script = os.path.join(self.tempdir, "script.py")
+        with open(self.script, "w") as f:
+            f.write("import sys\nprint('hello')\nsys.exit(3)\n")
+
+    def tearDown(self) -> None:
+        import shutil
+
+        shutil.rmtree(self.tempdir)
+
+    def test_run_pyfile_in_all_matching(self):
+        outputs = []
+        with patch.object(self.manager, "find_matching", return_value=iter(self.envs)):
+            results = self.manager.run_pyfile_in_all_matching(
+                ["numpy"],
+                self.script,
+                max_parallel=2,
+                on_output=lambda env, out, err: outputs.append((env["hash"], out)),
+            )
+        self.assertEqual([r["hash"] for r in results], ["hash0", "hash1", "hash2"])
+        for r in results:
+            self.assertEqual(r["returncode"], 3)
+            self.assertEqual(r["error"], "Process exited with 3")
+            self.assertGreater(r["duration"], 0)
+        for env in self.envs:
+            self.assertIn(
+                b"hello",
+                b"".join(out for h, out in outputs if h == env["hash"]),
+            )
+
+    def test_print_tagged_output(self):
+        import io
+        from envpicker.manager.base import print_tagged_output
+
+        # text-only streams without a buffer, e.g. in notebooks
+        stdout, stderr = io.StringIO(), io.StringIO()
+        with patch("sys.stdout", stdout), patch("sys.stderr", stderr):
+            print_tagged_output(self.envs[0], b"a\nb", b"err\n")
+        self.assertEqual(stdout.getvalue(), "[env0 hash0] a\n[env0 hash0] b\n")
+        self.assertEqual(stderr.getvalue(), "[env0 hash0] err\n")
+
+        buffer = io.BytesIO()
+        with patch("sys.stdout", Mock(buffer=buffer)):
+            print_tagged_output(self.envs[0], b"a\n", b"")
+        self.assertEqual(buffer.getvalue(), b"[env0 hash0] a\n")
+
+    def test_run_pyfile_in_all_matching_no_match(self):
+        with patch.object(self.manager, "find_matching", return_value=iter([])):
+            self.assertEqual(
+                self.manager.run_pyfile_in_all_matching(["numpy"], self.script), []
+            )
+
+
+class TestRegistryMaintenance(unittest.TestCase):
+    def setUp(self) -> None:
+        from envpicker.manager.base import BaseEnvManager
+        import sys
+
+        class MockBaseEnvManager(BaseEnvManager):
+            @classmethod
+            def is_available(cls):
+                return True
+
+            @classmethod
+            def register_all(cls):
+                pass
+
+            def get_dependencies(self, env):
+                return []
+
+        self.MockBaseEnvManager = MockBaseEnvManager
+        self.tempdir = tempfile.mkdtemp()
+        self.manager = MockBaseEnvManager(path=os.path.join(self.tempdir, "registry"))
+        self.env_paths = []
+        for name in ("env1", "env2"):
+            env_path = os.path.join(self.tempdir, name)
+            os.makedirs(env_path)
+            self.manager.add_env(env_path, sys.executable, name=name)
+            self.env_paths.append(env_path)
+
+    def tearDown(self) -> None:
+        import shutil
+
+        shutil.rmtree(self.tempdir)
+
+    def test_validates_only_new_entries(self):
+        import sys
+
+        env_path = os.path.join(self.tempdir, "env3")
+        os.makedirs(env_path)
+        with patch.object(
+            self.MockBaseEnvManager,
+            "validate_env",
+            wraps=self.MockBaseEnvManager.validate_env,
+        ) as validate_env:
+            self.manager.add_env(env_path, sys.executable, name="env3")
+        self.assertEqual(validate_env.call_count, 1)
+        self.assertEqual(validate_env.call_args[0][0]["name"], "env3")
+
+    def test_deleted_env_does_not_break_writes(self):
+        import shutil
+        import sys
+
+        shutil.rmtree(self.env_paths[0])
+        env_path = os.path.join(self.tempdir, "env3")
+        os.makedirs(env_path)
+        self.manager.add_env(env_path, sys.executable, name="env3")
+        self.assertEqual(len(self.manager.environments), 3)
+
+    def test_concurrent_registrations(self):
+        import sys
+        import threading
+
+        envs = self.manager.environments
+        envs.append(dict(envs[0], hash="other"))
+        # the returned list is a copy
+        self.assertEqual(len(self.manager.environments), 2)
+
+        def register(i):
+            env_path = os.path.join(self.tempdir, f"thread{i}")
+            os.makedirs(env_path)
+            self.manager.add_env(env_path, sys.executable, name=f"thread{i}")
+
+        threads = [threading.Thread(target=register, args=(i,)) for i in range(8)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        self.assertEqual(len(self.manager.environments), 10)
+        self.assertEqual(len(self.manager.registry.get("fingerprints")), 10)
+
+    def test_prune(self):
+        import shutil
+
+        shutil.rmtree(self.env_paths[0])
+        orphan = os.path.join(self.manager.path, "0" * 32 + ".yaml")
+        with open(orphan, "w") as f:
+            f.write("name: orphan\ndependencies: []\n")
+        removed_hash = self.manager.environments[0]["hash"]
+
+        result = self.manager.prune()
+        self.assertEqual([e["name"] for e in result["environments"]], ["env1"])
+        self.assertEqual(
+            sorted(result["files"]),
+            sorted(
+                [orphan, os.path.join(self.manager.path, f"{removed_hash}.yaml")]
+            ),
+        )
+        self.assertEqual([e["name"] for e in self.manager.environments], ["env2"])
+        self.assertTrue(
+            os.path.isfile(
+                os.path.join(
+                    self.manager.path, f"{self.manager.environments[0]['hash']}.yaml"
+                )
+            )
+        )
+        self.assertEqual(self.manager.prune(), {"environments": [], "files": []})
+
+    def test_prune_in_background_uses_registry_lock(self):
+        import shutil
+        import time
+
+        shutil.rmtree(self.env_paths[0])
+        with self.manager.registry_lock:
+            stop = self.manager.prune_in_background(0.01)
+            time.sleep(0.2)
+            # the pruning thread waits for the lock
+            self.assertEqual(len(self.manager.environments), 2)
+        try:
+            deadline = time.monotonic() + 5
+            while len(self.manager.environments) > 1 and time.monotonic() < deadline:
+                time.sleep(0.01)
+            self.assertEqual([e["name"] for e in self.manager.environments], ["env2"])
+        finally:
+            stop.set()
+
+    def test_prune_removed_interpreter(self):
+        env_path = os.path.join(self.tempdir, "env3")
+        py_executable = os.path.join(env_path, "bin", "python")
+        os.makedirs(os.path.dirname(py_executable))
+        with open(py_executable, "w") as f:
+            f.write("")
+        self.manager.add_env(env_path, py_executable, name="env3")
+
+        self.assertEqual(self.manager.prune()["environments"], [])
+        os.remove(py_executable)
+        result = self.manager.prune()
+        self.assertEqual([e["name"] for e in result["environments"]], ["env3"])
+
+
+class TestFindExact(unittest.TestCase):
+    def setUp(self) -> None:
+        from envpicker.manager.base import BaseEnvManager
+        import sys
+
+        dependencies = {
+            "env1": ["numpy=1.19.0", "python=3.9.1", "pandas==1.5.0"],
+            "env2": ["numpy=1.24.0", "python=3.9.1", "pandas==1.5.0"],
+        }
+
+        class MockBaseEnvManager(BaseEnvManager):
+            @classmethod
+            def is_available(cls):
+                return True
+
+            @classmethod
+            def register_all(cls):
+                pass
+
+            def get_dependencies(self, env):
+                return dependencies[env["name"]]
+
+        self.dependencies = dependencies
+        self.tempdir = tempfile.mkdtemp()
+        self.manager = MockBaseEnvManager(path=os.path.join(self.tempdir, "registry"))
+        for name in dependencies:
+            env_path = os.path.join(self.tempdir, name)
+            os.makedirs(env_path)
+            self.manager.add_env(env_path, sys.executable, name=name)
+
+    def tearDown(self) -> None:
+        import shutil
+
+        shutil.rmtree(self.tempdir)
+
+    def test_fully_pinned(self):
+        env = self.manager.find_exact(
+            ["Pandas==1.5.0", "numpy==1.24.0", "python==3.9.1"]
+        )
+        self.assertEqual(env["name"], "env2")
+        self.assertIsNone(self.manager.find_exact(["numpy==1.24.0", "python==3.9.1"]))
+        self.assertIsNone(
+            self.manager.find_exact(["numpy==1.24.1", "python==3.9.1", "pandas==1.5.0"])
+        )
+
+    def test_fully_pinned_single_lookup(self):
+        with patch.object(self.manager, "env_to_full_env") as env_to_full_env:
+            env = self.manager.find_exact(
+                ["pandas==1.5.0", "numpy==1.19.0", "python==3.9.1"]
+            )
+            env_to_full_env.assert_not_called()
+        self.assertEqual(env["name"], "env1")
+
+    def test_fingerprint_index_is_cached(self):
+        lock = ["pandas==1.5.0", "numpy==1.19.0", "python==3.9.1"]
+        self.manager.find_exact(lock)
+        with patch.object(
+            self.manager.registry, "get", wraps=self.manager.registry.get
+        ) as registry_get:
+            env = self.manager.find_exact(lock)
+            registry_get.assert_not_called()
+        self.assertEqual(env["name"], "env1")
+
+        # the index is rebuilt after an environment is removed
+        self.manager.remove_env(env["path"])
+        self.assertIsNone(self.manager.find_exact(lock))
+
+    def test_with_ranges(self):
+        env = self.manager.find_exact(["pandas==1.5.0", "numpy>=1.20", "python==3.9.1"])
+        self.assertEqual(env["name"], "env2")
+        self.assertIsNone(
+            self.manager.find_exact(["pandas==1.5.0", "numpy>=1.30", "python==3.9.1"])
+        )
+
+    def test_normalized_names_and_versions(self):
+        import sys
+
+        self.dependencies["env3"] = ["typing-extensions=4.5.0", "numpy=1.19.0"]
+        env_path = os.path.join(self.tempdir, "env3")
+        os.makedirs(env_path)
+        self.manager.add_env(env_path, sys.executable, name="env3")
+
+        for lock in (
+            ["typing_extensions>=4", "numpy==1.19.0"],
+            ["typing_extensions>=4", "numpy==1.19"],
+            ["typing_extensions==4.5", "numpy==1.19"],
+        ):
+            env = self.manager.find_exact(lock)
+            self.assertEqual(env["name"], "env3", lock)
+
+    def test_ranges_use_cached_records(self):
+        lock = ["pandas==1.5.0", "numpy>=1.20", "python==3.9.1"]
+        self.manager.find_exact(lock)
+        with patch.object(self.manager, "env_to_full_env") as env_to_full_env:
+            env = self.manager.find_exact(lock)
+            env_to_full_env.assert_not_called()
+        self.assertEqual(env["name"], "env2")
+
+    def test_backfills_fingerprints(self):
+        self.manager.registry.clear("fingerprints")
+        env = self.manager.find_exact(
+            ["pandas==1.5.0", "numpy==1.19.0", "python==3.9.1"]
+        )
+        self.assertEqual(env["name"], "env1")
+        self.assertEqual(len(self.manager.registry.get("fingerprints")), 2)
+
+
+class TestFindForScript(unittest.TestCase):
+    def setUp(self) -> None:
+        from envpicker.manager.base import BaseEnvManager
+        import sys
+
+        class MockBaseEnvManager(BaseEnvManager):
+            @classmethod
+            def is_available(cls):
+                return True
+
+            @classmethod
+            def register_all(cls):
+                pass
+
+            def get_dependencies(self, env):
+                return []
+
+        self.tempdir = tempfile.mkdtemp()
+        self.manager = MockBaseEnvManager(path=os.path.join(self.tempdir, "registry"))
+        self.env_paths = {}
+        for name, dists in {
+            "env1": ["numpy"],
+            "env2": ["numpy", "pyyaml"],
+        }.items():
+            env_path = os.path.join(self.tempdir, name)
+            self.env_paths[name] = env_path
+            sp = os.path.join(env_path, "lib", "python3.11", "site-packages")
+            for dist in dists:
+                meta = os.path.join(sp, f"{dist}-1.0.dist-info")
+                os.makedirs(meta)
+                with open(os.path.join(meta, "top_level.txt"), "w") as f:
+                    f.write("yaml\n" if dist == "pyyaml" else f"{dist}\n")
+            self.manager.add_env(env_path, sys.executable, name=name)
+        self.script = os.path.join(self.tempdir, "script.py")
+
+    def tearDown(self) -> None:
+        import shutil
+
+        shutil.rmtree(self.tempdir)
+
+    def _script(self, content):
+        with open(self.script, "w") as f:
+            f.write(content)
+        return self.script
+
+    def test_find_for_script(self):
+        script = self._script("import numpy\nimport yaml\n")
+        self.assertEqual(
+            [e["name"] for e in self.manager.find_for_script(script)], ["env2"]
+        )
+        script = self._script("import numpy\n")
+        self.assertEqual(
+            [e["name"] for e in self.manager.find_for_script(script)],
+            ["env1", "env2"],
+        )
+        script = self._script("import yaml\nimport torch\n")
+        self.assertEqual(
+            self.manager.script_requirements(script),
+            {"torch": None, "yaml": "pyyaml"},
+        )
+        self.assertEqual(self.manager.find_for_script(self.script), [])
+
+    def test_index_is_persisted(self):
+        manager = type(self.manager)(path=self.manager.path)
+        self.assertEqual(
+            manager.module_index.get("numpy"),
+            {
+                self.manager.get_env_by_path(self.env_paths["env1"])["hash"]: "numpy",
+                self.manager.get_env_by_path(self.env_paths["env2"])["hash"]: "numpy",
+            },
+        )
+
+    def test_backfills_missing_modules(self):
+        # e.g. environments registered before the module index existed
+        os.remove(os.path.join(self.manager.path, "modules.yml"))
+        manager = type(self.manager)(path=self.manager.path)
+        script = self._script("import numpy\nimport yaml\n")
+        self.assertEqual([e["name"] for e in manager.find_for_script(script)], ["env2"])
+        self.assertTrue(os.path.isfile(os.path.join(manager.path, "modules.yml")))
+
+    def test_shared_index_environments(self):
+        index_path = os.path.join(self.tempdir, "index.bin")
+        self.manager.publish_index(index_path)
+        node = type(self.manager)(
+            path=os.path.join(self.tempdir, "node"), shared_index=index_path
+        )
+        script = self._script("import yaml\n")
+        # the modules are published with the index, the node does not scan the environments
+        with patch("envpicker.manager.base.distribution_modules") as scan:
+            self.assertEqual(
+                [e["name"] for e in node.find_for_script(script)], ["env2"]
+            )
+            self.assertEqual(node.script_requirements(script), {"yaml": "pyyaml"})
+        scan.assert_not_called()
+        node.shared_index.close()
+
+    def test_envs_without_distributions_are_not_rescanned(self):
+        import sys
+
+        env_path = os.path.join(self.tempdir, "env3")
+        os.makedirs(env_path)
+        self.manager.add_env(env_path, sys.executable, name="env3")
+        manager = type(self.manager)(path=self.manager.path)
+        with patch("envpicker.manager.base.distribution_modules") as scan:
+            manager.find_for_script(self._script("import numpy\n"))
+        scan.assert_not_called()
+
+        # the marker is dropped with the environment
+        env_hash = manager.get_env_by_path(env_path)["hash"]
+        self.assertIn(env_hash, manager.module_index.get(".empty"))
+        manager.remove_env(env_path)
+        self.assertIsNone(manager.module_index.get(".empty"))
+
+    def test_remove_env_forgets_modules(self):
+        self.manager.remove_env(self.env_paths["env2"])
+        self.assertIsNone(self.manager.module_index.get("yaml"))
+        self.assertEqual(len(self.manager.module_index.get("numpy")), 1)
+
+    def test_first_for_script(self):
+        from envpicker.manager.base import NoMatchingEnvironmentError
+
+        with self.assertRaises(NoMatchingEnvironmentError):
+            self.manager.first_for_script(self._script("import torch\n"))
+        self.manager.remove_env(self.env_paths["env2"])
+        script = self._script("import numpy, yaml\n")
+        self.manager.module_index.set("yaml", "gone", value="pyyaml")
+        with patch.object(self.manager, "provision") as provision:
+            provision.return_value = {
+                "hash": "h",
+                "path": "p",
+                "name": "n",
+                "py_executable": "py",
+                "envdata": None,
+            }
+            env = self.manager.first_for_script(script, provision=True)
+        provision.assert_called_once_with(["numpy", "pyyaml"])
+        self.assertEqual(env["hash"], "h")
+
+    def test_run_pyfile_by_imports(self):
+        script = self._script("import yaml\nprint('picked')\n")
+        with patch.object(self.manager, "run_pyfile_in_env") as run:
+            run.return_value = iter([(b"picked\n", b"")])
+            output = list(self.manager.run_pyfile_by_imports(script))
+        self.assertEqual(output, [(b"picked\n", b"")])
+        self.assertEqual(run.call_args[0][0]["name"], "env2")
@@ -0,0 +1,139 @@
+import unittest
+from unittest.mock import patch, Mock
+import io
+import sys
+import subprocess
+
+
+class TestCli(unittest.TestCase):
+    def setUp(self) -> None:
+        self.envs = [
+            {
+                "hash": "hash1",
+                "path": "/envs/env1",
+                "name": "env1",
+                "py_executable": "/envs/env1/bin/python",
+            },
+            {
+                "hash": "hash2",
+                "path": "/envs/env2",
+                "name": "env2",
+                "py_executable": "/envs/env2/bin/python",
+            },
+        ]
+        self.manager = Mock()
+        self.manager.environments = self.envs
+        self.manager.find_matching.side_effect = lambda reqs: iter(self.envs)
+
+    def test_import_is_lightweight(self):
+        code = (
+            "import sys, envpicker.cli;"
+            "print(','.join(m for m in ('yaml', 'wrapconfig', 'packaging', 'hashlib',"
+            " 'envpicker.manager') if m in sys.modules))"
+        )
+        out = subprocess.check_output([sys.executable, "-c", code])
+        self.assertEqual(out.strip(), b"")
+
+    def _run(self, argv):
+        from envpicker.cli import main
+
+        stdout = io.StringIO()
+        with patch("envpicker.manager.get_manager", return_value=self.manager) as gm:
+            with patch("sys.stdout", stdout):
+                rc = main(argv)
+        return rc, stdout.getvalue(), gm
+
+    def test_list(self):
+        rc, out, gm = self._run(["--manager", "conda", "list"])
+        self.assertEqual(rc, 0)
+        self.assertEqual(
+            out, "hash1\tenv1\t/envs/env1\nhash2\tenv2\t/envs/env2\n"
+        )
+        gm.assert_called_once_with(
+            path=None, preferences=["conda"], check_available=False
+        )
+
+    def test_match(self):
+        rc, out, gm = self._run(["match", "numpy>=1", "--first"])
+        self.assertEqual(rc, 0)
+        self.assertEqual(out, "hash1\tenv1\t/envs/env1\n")
+        self.manager.find_matching.assert_called_once_with(["numpy>=1"])
+        gm.assert_called_once_with(path=None, preferences=None, check_available=False)
+
+    def test_read_only_commands_do_not_spawn(self):
+        import tempfile
+        import shutil
+        from envpicker.cli import main
+
+        path = tempfile.mkdtemp()
+        try:
+            for argv in (["list"], ["match", "numpy>=1"]):
+                with patch("subprocess.Popen", side_effect=AssertionError) as popen:
+                    with patch("sys.stdout", io.StringIO()):
+                        main(["--path", path] + argv)
+                popen.assert_not_called()
+        finally:
+            shutil.rmtree(path)
+
+    def test_match_none(self):
+        self.manager.find_matching.side_effect = lambda reqs: iter([])
+        rc, out, _ = self._run(["match", "numpy>=1"])
+        self.assertEqual(rc, 1)
+        self.assertEqual(out, "")
+
+    def test_run(self):
+        self.manager.run_pyfile_in_env.return_value = iter([(b"out\n", b"")])
+        stdout = Mock()
+        with patch("sys.stdout", Mock(buffer=stdout)):
+            from envpicker.cli import main
+
+            with patch("envpicker.manager.get_manager", return_value=self.manager):
+                rc = main(["run", "numpy>=1", "--", "script.py"])
+        self.assertEqual(rc, 0)
+        self.manager.run_pyfile_in_env.assert_called_once_with(
+            self.envs[0], "script.py", None, self.manager.scheduler
+        )
+        stdout.write.assert_called_once_with(b"out\n")
+
+    def test_run_timeout(self):
+        def _timeout(*args):
+            yield b"out\n", b""
+            raise subprocess.TimeoutExpired(["python", "script.py"], 1.0)
+
+        self.manager.run_pyfile_in_env.side_effect = _timeout
+        stderr = io.StringIO()
+        stderr.buffer = Mock()
+        with patch("sys.stdout", Mock(buffer=Mock())), patch("sys.stderr", stderr):
+            from envpicker.cli import main
+
+            with patch("envpicker.manager.get_manager", return_value=self.manager):
+                rc = main(["run", "--timeout", "1", "numpy>=1", "--", "script.py"])
+        self.assertEqual(rc, 124)
+        self.assertEqual(stderr.getvalue(), "Timed out after 1.0 seconds\n")
+
+    def test_pick(self):
+        self.manager.find_for_script.return_value = self.envs
+        rc, out, _ = self._run(["pick", "script.py", "--first"])
+        self.assertEqual(rc, 0)
+        self.assertEqual(out, "hash1\tenv1\t/envs/env1\n")
+        self.manager.find_for_script.assert_called_once_with("script.py")
+
+    def test_run_by_imports(self):
+        self.manager.first_for_script.return_value = self.envs[1]
+        self.manager.run_pyfile_in_env.return_value = iter([])
+        with patch("sys.stdout", Mock(buffer=Mock())):
+            from envpicker.cli import main
+
+            with patch("envpicker.manager.get_manager", return_value=self.manager):
+                rc = main(["run", "--", "script.py"])
+        self.assertEqual(rc, 0)
+        self.manager.first_for_script.assert_called_once_with("script.py")
+        self.manager.run_pyfile_in_env.assert_called_once_with(
+            self.envs[1], "script.py", None, self.manager.scheduler
+        )
+
+    def test_run_requires_script(self):
+        from envpicker.cli import main
+
+        with self.assertRaises(SystemExit), patch("sys.stderr", io.StringIO()):
+            main(["run", "numpy>=1"])
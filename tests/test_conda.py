@@ -3,6 +3,7 @@ from unittest.mock import patch, Mock
 import hashlib
 import os
 import tempfile
+import subprocess
 
 from envpicker import CondaManager, MambaManager
 
@@ -76,3 +77,196 @@ class TestMambaManager(TestCondaManager):
     def setUp(self):
         super().setUp()
         self.manager_cls = MambaManager
+
+
+FAKE_CONDA = r'''#!{python}
+import json
+import os
+import shutil
+import sys
+
+ROOT = {root!r}
+args = sys.argv[1:]
+# bin/python of the fake environments links to this script
+if os.path.basename(sys.argv[0]) == "python":
+    if args[:3] != ["-m", "pip", "install"]:
+        os.execv(sys.executable, [sys.executable] + args)
+    args = ["pip"] + args[2:] + ["-p", os.path.dirname(os.path.dirname(sys.argv[0]))]
+with open(os.path.join(ROOT, "calls.log"), "a") as f:
+    f.write(" ".join(args) + "\n")
+
+
+def option(name):
+    return args[args.index(name) + 1]
+
+
+def load(path):
+    with open(os.path.join(path, "packages.json")) as f:
+        return json.load(f)
+
+
+def load_pip(path):
+    try:
+        with open(os.path.join(path, "pip.json")) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return []
+
+
+def save(path, packages, pip=()):
+    os.makedirs(os.path.join(path, "bin"), exist_ok=True)
+    os.makedirs(os.path.join(path, "conda-meta"), exist_ok=True)
+    if not os.path.exists(os.path.join(path, "bin", "python")):
+        os.symlink(os.path.join(ROOT, "conda"), os.path.join(path, "bin", "python"))
+    with open(os.path.join(path, "packages.json"), "w") as f:
+        json.dump(packages, f)
+    with open(os.path.join(path, "pip.json"), "w") as f:
+        json.dump(sorted(pip), f)
+
+
+def install(packages, specs):
+    for spec in specs:
+        for sep in ("==", ">=", "<=", "=", ">", "<"):
+            if sep in spec:
+                name, version = spec.split(sep, 1)
+                packages[name] = version.split(",")[0]
+                break
+
+
+if args[:2] == ["info", "--json"]:
+    print(json.dumps({{"envs_dirs": [os.path.join(ROOT, "envs")]}}))
+elif args[0] == "create":
+    target = option("-p")
+    pip = []
+    if "--clone" in args:
+        packages = load(option("--clone"))
+        pip = load_pip(option("--clone"))
+    else:
+        packages = {{}}
+        install(packages, [a for a in args[1:] if not a.startswith("-") and a != target])
+    save(target, packages, pip)
+elif args[0] in ("install", "pip"):
+    target = option("-p")
+    packages = load(target)
+    specs = [a for a in args[1:] if not a.startswith("-") and a not in (target, "install")]
+    install(packages, specs)
+    pip = set(load_pip(target))
+    if args[0] == "pip":
+        pip.update(spec.split("=")[0].split(">")[0] for spec in specs)
+    save(target, packages, pip)
+elif args[:3] == ["remove", "--all", "--yes"]:
+    shutil.rmtree(option("-p"))
+elif args[:2] == ["env", "export"]:
+    packages = load(option("-p"))
+    pip = load_pip(option("-p"))
+    print("name: env\ndependencies:")
+    for name, version in packages.items():
+        if name not in pip:
+            print("  - %s=%s" % (name, version))
+    if pip:
+        print("  - pip:")
+        for name in pip:
+            print("    - %s==%s" % (name, packages[name]))
+else:
+    sys.exit("unsupported call %s" % args)
+'''
+
+
+@unittest.skipIf(os.name == "nt", "the fake conda executable requires a posix shell")
+class TestCondaProvision(unittest.TestCase):
+    def setUp(self):
+        import sys
+
+        self.tempdir = tempfile.mkdtemp()
+        fake_conda = os.path.join(self.tempdir, "conda")
+        with open(fake_conda, "w") as f:
+            f.write(FAKE_CONDA.format(python=sys.executable, root=self.tempdir))
+        os.chmod(fake_conda, 0o755)
+
+        class FakeCondaManager(CondaManager):
+            CONDACMD = fake_conda
+
+        self.manager = FakeCondaManager(path=os.path.join(self.tempdir, "registry"))
+        # two existing environments
+        for name, packages in (
+            ("base1", {"python": "3.9.1", "numpy": "1.19.0"}),
+            ("base2", {"python": "3.10.2", "numpy": "1.24.0", "pandas": "1.5.0"}),
+        ):
+            subprocess.check_output(
+                [fake_conda, "create", "-p", os.path.join(self.tempdir, "envs", name)]
+                + [f"{k}=={v}" for k, v in packages.items()]
+            )
+            self.manager.register_environment(
+                os.path.join(self.tempdir, "envs", name), name=name
+            )
+        os.remove(os.path.join(self.tempdir, "calls.log"))
+
+    def tearDown(self):
+        import shutil
+
+        shutil.rmtree(self.tempdir)
+
+    def calls(self):
+        with open(os.path.join(self.tempdir, "calls.log")) as f:
+            return f.read().splitlines()
+
+    def test_find_closest(self):
+        env, unmet = self.manager.find_closest(["numpy>=1.20", "scipy>=1.0"])
+        self.assertEqual(env["name"], "base2")
+        self.assertEqual(unmet, ["scipy>=1.0"])
+
+    def test_provision_clones_closest(self):
+        env = self.manager.provision(["numpy>=1.20", "scipy>=1.10"], name="new")
+        self.assertEqual(env["path"], os.path.join(self.tempdir, "envs", "new"))
+        self.assertIn("scipy=1.10", env["envdata"]["dependencies"])
+        self.assertIn("pandas=1.5.0", env["envdata"]["dependencies"])
+        calls = [c for c in self.calls() if c.startswith(("create", "install"))]
+        self.assertEqual(len(calls), 2)
+        self.assertTrue(
+            calls[0].startswith("create")
+            and "--clone " + os.path.join(self.tempdir, "envs", "base2") in calls[0]
+        )
+        self.assertTrue(calls[1].startswith("install") and calls[1].endswith("scipy>=1.10"))
+        self.assertEqual(
+            next(self.manager.find_matching(["scipy>=1.10"]))["path"], env["path"]
+        )
+
+    def test_provision_updates_pip_packages_with_pip(self):
+        base2 = os.path.join(self.tempdir, "envs", "base2")
+        subprocess.check_output(
+            [os.path.join(base2, "bin", "python"), "-m", "pip", "install", "black==22.0"]
+        )
+        self.manager.create_env_yaml(self.manager.get_env_by_path(base2))
+        os.remove(os.path.join(self.tempdir, "calls.log"))
+
+        env = self.manager.provision(["numpy>=1.20", "black>=23"], name="new")
+        self.assertIn("black==23", env["envdata"]["dependencies"])
+        calls = [c for c in self.calls() if not c.startswith(("info", "env export"))]
+        self.assertEqual(len(calls), 2)
+        self.assertTrue(calls[0].startswith("create"))
+        self.assertTrue(calls[1].startswith("pip install") and "black>=23" in calls[1])
+
+    def test_failed_provision_is_removed(self):
+        from envpicker.manager.base import NoMatchingEnvironmentError
+
+        target = os.path.join(self.tempdir, "envs", "new")
+        for _ in range(2):
+            # no EnvExistsError on the second attempt
+            with self.assertRaises(NoMatchingEnvironmentError):
+                self.manager.provision(["numpy>=1.20,<1.0"], name="new")
+            self.assertFalse(os.path.exists(target))
+            self.assertIsNone(self.manager.get_env_by_path(target))
+
+    def test_run_with_provision(self):
+        from envpicker.manager.base import NoMatchingEnvironmentError
+
+        with self.assertRaises(NoMatchingEnvironmentError):
+            list(self.manager.run_py_in_matching(["scipy>=1.10"], "print('hi')"))
+
+        out = b"".join(
+            o
+            for o, _ in self.manager.run_py_in_matching(
+                ["scipy>=1.10"], "print('hi')", provision=True
+            )
+        )
+        self.assertIn(b"hi", out)
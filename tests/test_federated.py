@@ -0,0 +1,85 @@
+import unittest
+from unittest.mock import patch
+import os
+import sys
+import shutil
+import tempfile
+
+
+def make_backend_cls(name, cost, env_paths, fail=False):
+    from envpicker.manager.base import BaseEnvManager
+
+    class Backend(BaseEnvManager):
+        EXTRACTION_COST = cost
+        calls = []
+
+        @classmethod
+        def is_available(cls):
+            return True
+
+        def register_all(self):
+            pass
+
+        def list_env_paths(self):
+            return env_paths
+
+        def get_dependencies(self, env):
+            type(self).calls.append(env["path"])
+            if fail:
+                raise RuntimeError("export failed")
+            return [f"{name}==1.0"]
+
+    Backend.__name__ = name
+    return Backend
+
+
+class TestFederatedManager(unittest.TestCase):
+    def setUp(self) -> None:
+        self.tempdir = tempfile.mkdtemp()
+        self.env_paths = []
+        for name in ("env1", "env2", "env3"):
+            env_path = os.path.join(self.tempdir, "envs", name)
+            os.makedirs(env_path)
+            self.env_paths.append(env_path)
+        self.registry = os.path.join(self.tempdir, "registry")
+
+    def tearDown(self) -> None:
+        shutil.rmtree(self.tempdir)
+
+    def _manager(self, backends):
+        from envpicker.manager.federated import FederatedManager
+
+        return FederatedManager(
+            path=self.registry, backends=[b(path=self.registry) for b in backends]
+        )
+
+    def test_deduplicates_and_uses_cheapest(self):
+        expensive = make_backend_cls("conda", 100, self.env_paths[:2])
+        # trailing separator, same environment after normalization
+        cheap = make_backend_cls(
+            "mamba", 50, [self.env_paths[0] + os.sep, self.env_paths[2]]
+        )
+        manager = self._manager([expensive, cheap])
+        self.assertEqual(sorted(manager.list_env_paths()), sorted(self.env_paths))
+
+        with patch("subprocess.check_output", return_value=b"Python 3.9.1"), patch(
+            "os.path.isfile", return_value=True
+        ):
+            manager.register_all()
+        self.assertEqual(len(manager.environments), 3)
+        self.assertEqual(sorted(cheap.calls), sorted(self.env_paths))
+        self.assertEqual(expensive.calls, [])
+        self.assertEqual(len(list(manager.find_matching(["mamba>=1"]))), 3)
+
+    def test_falls_back_to_next_backend(self):
+        expensive = make_backend_cls("conda", 100, self.env_paths)
+        cheap = make_backend_cls("mamba", 50, self.env_paths, fail=True)
+        manager = self._manager([cheap, expensive])
+        env = {
+            "hash": "hash",
+            "path": self.env_paths[0],
+            "name": "env1",
+            "py_executable": sys.executable,
+        }
+        self.assertEqual(manager.get_dependencies(env), ["conda==1.0"])
+        self.assertEqual(cheap.calls, [self.env_paths[0]])
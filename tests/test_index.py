@@ -0,0 +1,111 @@
+import unittest
+from unittest.mock import patch
+import os
+import sys
+import shutil
+import tempfile
+
+
+def make_manager_cls():
+    from envpicker.manager.base import BaseEnvManager
+
+    class MockBaseEnvManager(BaseEnvManager):
+        DEPENDENCIES = {}
+
+        @classmethod
+        def is_available(cls):
+            return True
+
+        @classmethod
+        def register_all(cls):
+            pass
+
+        def get_dependencies(self, env):
+            return self.DEPENDENCIES[env["name"]]
+
+    return MockBaseEnvManager
+
+
+class TestSharedIndex(unittest.TestCase):
+    def setUp(self) -> None:
+        self.tempdir = tempfile.mkdtemp()
+        self.manager_cls = make_manager_cls()
+        self.manager_cls.DEPENDENCIES = {
+            "env1": ["numpy==1.19.0", "python==3.9.1"],
+            "env2": ["numpy==1.24.0", "pandas==1.5.0"],
+            "local": ["scipy==1.10.0"],
+        }
+        self.publisher = self.manager_cls(path=os.path.join(self.tempdir, "publisher"))
+        for name in ("env1", "env2"):
+            env_path = os.path.join(self.tempdir, "envs", name)
+            os.makedirs(env_path)
+            self.publisher.add_env(env_path, sys.executable, name=name)
+        self.index_path = os.path.join(self.tempdir, "index.bin")
+        self.publisher.publish_index(self.index_path)
+
+    def tearDown(self) -> None:
+        shutil.rmtree(self.tempdir)
+
+    def test_read_index(self):
+        from envpicker.manager.index import SharedIndex
+
+        index = SharedIndex(self.index_path)
+        self.assertEqual(len(index), 2)
+        self.assertEqual(index.environments, self.publisher.environments)
+        env = self.publisher.environments[1]
+        self.assertIn(env["hash"], index)
+        self.assertEqual(index.get(env["hash"]), env)
+        envdata = index.envdata(env["hash"])
+        self.assertEqual(envdata["name"], "env2")
+        self.assertEqual(envdata["dependencies"], ["numpy==1.24.0", "pandas==1.5.0"])
+        index.close()
+
+    def test_modules(self):
+        import json
+        from envpicker.manager.index import SharedIndex, INDEX_MAGIC
+
+        index = SharedIndex(self.index_path)
+        env = self.publisher.environments[0]
+        # the test environments have no distributions
+        self.assertEqual(index.modules(env["hash"]), {})
+        self.assertIsNone(index.modules("unknown"))
+        index.close()
+
+        # indexes published without modules
+        path = os.path.join(self.tempdir, "old.bin")
+        with open(path, "wb") as f:
+            f.write(INDEX_MAGIC + json.dumps({"environments": []}).encode() + b"\n")
+        index = SharedIndex(path)
+        self.assertIsNone(index.modules(env["hash"]))
+        index.close()
+
+    def test_invalid_index(self):
+        from envpicker.manager.index import SharedIndex
+
+        path = os.path.join(self.tempdir, "invalid")
+        with open(path, "wb") as f:
+            f.write(b"no index")
+        with self.assertRaises(ValueError):
+            SharedIndex(path)
+
+    def test_layered_registry(self):
+        node = self.manager_cls(
+            path=os.path.join(self.tempdir, "node"), shared_index=self.index_path
+        )
+        self.assertEqual(node.environments, self.publisher.environments)
+        with patch.object(self.manager_cls, "get_dependencies") as get_deps:
+            env = next(node.find_matching(["numpy>=1.20"]))
+            get_deps.assert_not_called()
+        self.assertEqual(env["name"], "env2")
+
+        local_path = os.path.join(self.tempdir, "envs", "local")
+        os.makedirs(local_path)
+        node.add_env(local_path, sys.executable, name="local")
+        self.assertEqual(
+            [env["name"] for env in node.environments], ["local", "env1", "env2"]
+        )
+        # only the node specific environment is stored in the overlay
+        self.assertEqual(
+            [env["name"] for env in node.registry.get("environments")], ["local"]
+        )
+        self.assertEqual(next(node.find_matching(["scipy"]))["name"], "local")
@@ -0,0 +1,141 @@
+import unittest
+import os
+import sys
+import shutil
+import tempfile
+
+
+class TestTailBuffer(unittest.TestCase):
+    def test_keeps_tail(self):
+        from envpicker.manager.output import TailBuffer
+
+        buf = TailBuffer(10)
+        for i in range(100):
+            buf.write(b"%03d" % i)
+        self.assertEqual(buf.getvalue(), b"6097098099")
+        self.assertEqual(len(buf), 10)
+
+    def test_large_write(self):
+        from envpicker.manager.output import TailBuffer
+
+        buf = TailBuffer(4)
+        buf.write(b"ab")
+        buf.write(b"0123456789")
+        self.assertEqual(buf.getvalue(), b"6789")
+
+
+class TestLineFramer(unittest.TestCase):
+    def test_lines(self):
+        from envpicker.manager.output import LineFramer
+
+        framer = LineFramer()
+        self.assertEqual(framer.feed(b"a\nb"), [b"a\n"])
+        self.assertEqual(framer.feed(b"c\n\nd"), [b"bc\n", b"\n"])
+        self.assertEqual(framer.flush(), b"d")
+        self.assertIsNone(framer.flush())
+
+    def test_max_line(self):
+        from envpicker.manager.output import LineFramer
+
+        framer = LineFramer(max_line=4)
+        self.assertEqual(framer.feed(b"0123456789"), [b"0123", b"4567"])
+        self.assertEqual(framer.flush(), b"89")
+
+
+class TestOutputPipeline(unittest.TestCase):
+    def setUp(self) -> None:
+        self.tempdir = tempfile.mkdtemp()
+        self.env = {
+            "hash": "hash",
+            "path": self.tempdir,
+            "name": "env",
+            "py_executable": sys.executable,
+        }
+
+    def tearDown(self) -> None:
+        shutil.rmtree(self.tempdir)
+
+    def test_lines(self):
+        from envpicker.manager.base import BaseEnvManager
+        from envpicker.manager.output import OutputPipeline
+
+        command = (
+            "import sys\n"
+            "for i in range(3):\n"
+            "    sys.stdout.write('part%d-' % i)\n"
+            "    sys.stdout.flush()\n"
+            "print('end')\n"
+            "sys.stdout.write('last')\n"
+        )
+        out = [
+            o
+            for o, _ in BaseEnvManager.run_py_in_env(
+                self.env, command, output=OutputPipeline(lines=True)
+            )
+            if o
+        ]
+        self.assertEqual(out, [b"part0-part1-part2-end\n", b"last"])
+
+    def test_file_sinks(self):
+        from envpicker.manager.base import BaseEnvManager, ProcessError
+        from envpicker.manager.output import OutputPipeline
+
+        stdout_path = os.path.join(self.tempdir, "out.log")
+        stderr_path = os.path.join(self.tempdir, "err.log")
+        command = (
+            "import sys\n"
+            "print('x' * 100000)\n"
+            "sys.stderr.write('e' * 100000 + 'failed')\n"
+            "sys.exit(1)\n"
+        )
+        output = OutputPipeline(stdout=stdout_path, stderr=stderr_path, tail_size=10)
+        with self.assertRaises(ProcessError) as ctx:
+            for out, err in BaseEnvManager.run_py_in_env(
+                self.env, command, output=output
+            ):
+                self.assertFalse(out.strip())
+                self.assertFalse(err.strip())
+        self.assertEqual(ctx.exception.stderr, b"eeeefailed")
+        with open(stdout_path, "rb") as f:
+            self.assertEqual(f.read(), b"x" * 100000 + b"\n")
+
+    def test_bounded_stderr_tail(self):
+        from envpicker.manager.base import BaseEnvManager, ProcessError
+        from envpicker.manager.output import OutputPipeline
+
+        command = "import sys; sys.stderr.write('e' * 100000 + 'failed'); sys.exit(1)"
+        with self.assertRaises(ProcessError) as ctx:
+            list(
+                BaseEnvManager.run_py_in_env(
+                    self.env, command, output=OutputPipeline(tail_size=8)
+                )
+            )
+        self.assertEqual(ctx.exception.stderr, b"eefailed")
+
+    @unittest.skipUnless(os.path.exists("/proc/self/statm"), "needs /proc")
+    def test_backpressure(self):
+        import time
+        from envpicker.manager.base import BaseEnvManager
+
+        def rss():
+            with open("/proc/self/statm") as f:
+                return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+
+        size = 200 * 1024 * 1024
+        command = (
+            "import sys\n"
+            "block = b'x' * (1024 * 1024)\n"
+            f"for _ in range({size} // len(block)):\n"
+            "    sys.stdout.buffer.write(block)\n"
+        )
+        before = rss()
+        received = 0
+        gen = BaseEnvManager.run_py_in_env(self.env, command)
+        for out, _ in gen:
+            if not received:
+                # a slow consumer, the child has to wait for it
+                time.sleep(1)
+                grown = rss() - before
+            received += len(out)
+        self.assertEqual(received, size + 1)
+        self.assertLess(grown, 32 * 1024 * 1024)
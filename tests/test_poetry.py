@@ -0,0 +1,153 @@
+import unittest
+from unittest.mock import patch
+import os
+import sys
+import shutil
+import tempfile
+
+POETRY_LOCK = """# This file is automatically @generated by Poetry and should not be changed by hand.
+
+[[package]]
+name = "numpy"
+version = "1.24.0"
+description = "Fundamental package for array computing in Python"
+optional = false
+python-versions = ">=3.8"
+files = [
+    {file = "numpy-1.24.0.tar.gz", hash = "sha256:abc"},
+]
+
+[package.extras]
+test = ["pytest (>=7)"]
+
+[[package]]
+name = "pandas"
+version = "1.5.0"
+description = "Powerful data structures for data analysis"
+optional = false
+python-versions = ">=3.8"
+
+[package.dependencies]
+numpy = ">=1.21.0"
+
+[metadata]
+lock-version = "2.0"
+python-versions = "^3.9"
+content-hash = "abc"
+"""
+
+
+def make_project(root, name, with_venv=True):
+    project = os.path.join(root, name)
+    os.makedirs(project)
+    with open(os.path.join(project, "pyproject.toml"), "w") as f:
+        f.write(f'[tool.poetry]\nname = "{name}"\n')
+    with open(os.path.join(project, "poetry.lock"), "w") as f:
+        f.write(POETRY_LOCK)
+    if with_venv:
+        venv = os.path.join(project, ".venv")
+        os.makedirs(os.path.join(venv, "bin"))
+        os.symlink(sys.executable, os.path.join(venv, "bin", "python"))
+        with open(os.path.join(venv, "pyvenv.cfg"), "w") as f:
+            f.write("home = /usr/bin\nversion = 3.11.7\n")
+    return project
+
+
+@unittest.skipIf(os.name == "nt", "the test venvs use posix symlinks")
+class TestPoetryManager(unittest.TestCase):
+    def setUp(self) -> None:
+        self.tempdir = tempfile.mkdtemp()
+        self.root = os.path.join(self.tempdir, "projects")
+        self.project = make_project(self.root, "service1")
+        make_project(self.root, "no_venv", with_venv=False)
+        make_project(os.path.join(self.root, "web", "node_modules"), "skipped")
+
+    def tearDown(self) -> None:
+        shutil.rmtree(self.tempdir)
+
+    def test_read_lock_packages(self):
+        from envpicker.manager import poetry_mngr
+
+        lock = os.path.join(self.project, "poetry.lock")
+        expected = [("numpy", "1.24.0"), ("pandas", "1.5.0")]
+        self.assertEqual(poetry_mngr.read_lock_packages(lock), expected)
+        with patch.object(poetry_mngr, "tomllib", None):
+            self.assertEqual(poetry_mngr.read_lock_packages(lock), expected)
+
+    def test_find_projects(self):
+        from envpicker.manager.poetry_mngr import find_poetry_projects
+
+        self.assertEqual(find_poetry_projects([self.root]), [self.project])
+
+    def test_register_all_offline(self):
+        from envpicker.manager.poetry_mngr import PoetryManager
+
+        manager = PoetryManager(
+            path=os.path.join(self.tempdir, "registry"), roots=[self.root]
+        )
+        with patch("subprocess.check_output", side_effect=AssertionError("no calls")):
+            manager.register_all()
+        self.assertEqual(len(manager.environments), 1)
+        env = manager.environments[0]
+        self.assertEqual(env["name"], "service1")
+        self.assertEqual(env["path"], os.path.join(self.project, ".venv"))
+        self.assertEqual(
+            manager.env_to_full_env(env)["envdata"]["dependencies"],
+            ["numpy==1.24.0", "pandas==1.5.0", "python==3.11.7"],
+        )
+        self.assertEqual(
+            next(manager.find_matching(["pandas>=1.5", "python>=3.10"]))["name"],
+            "service1",
+        )
+        self.assertTrue(manager.handles_env(env))
+
+        # registering again does not duplicate the environment
+        manager.register_all()
+        self.assertEqual(len(manager.environments), 1)
+
+    def test_virtualenv_python_version(self):
+        from envpicker.manager.poetry_mngr import PoetryManager, venv_python_version
+
+        # pyvenv.cfg as written by virtualenv, which poetry uses to create its venvs
+        venv = os.path.join(self.project, ".venv")
+        with open(os.path.join(venv, "pyvenv.cfg"), "w") as f:
+            f.write(
+                "home = /usr/bin\n"
+                "implementation = CPython\n"
+                "version_info = 3.11.7.final.0\n"
+                "virtualenv = 20.25.0\n"
+                "include-system-site-packages = false\n"
+                "base-prefix = /usr\n"
+            )
+        self.assertEqual(venv_python_version(venv), "3.11.7")
+
+        manager = PoetryManager(
+            path=os.path.join(self.tempdir, "registry"), roots=[self.root]
+        )
+        manager.register_all()
+        self.assertEqual(
+            next(manager.find_matching(["python>=3.9"]))["name"], "service1"
+        )
+
+    def test_availability(self):
+        from envpicker.manager import get_manager, CondaManager, MambaManager
+        from envpicker.manager.poetry_mngr import PoetryManager
+
+        path = os.path.join(self.tempdir, "registry")
+        with patch.object(CondaManager, "is_available", return_value=False), patch.object(
+            MambaManager, "is_available", return_value=False
+        ):
+            with patch.dict(os.environ, {"ENVPICKER_POETRY_ROOTS": ""}):
+                self.assertFalse(PoetryManager.is_available())
+                with self.assertRaises(RuntimeError):
+                    get_manager(path=path)
+            with patch.dict(os.environ, {"ENVPICKER_POETRY_ROOTS": self.root}):
+                self.assertTrue(PoetryManager.is_available())
+                self.assertIsInstance(get_manager(path=path), PoetryManager)
+
+    def test_roots_from_environment(self):
+        from envpicker.manager.poetry_mngr import PoetryManager
+
+        with patch.dict(os.environ, {"ENVPICKER_POETRY_ROOTS": self.root}):
+            manager = PoetryManager(path=os.path.join(self.tempdir, "registry"))
+        self.assertEqual(manager.roots, [self.root])
@@ -0,0 +1,120 @@
+import unittest
+import os
+import sys
+import time
+import shutil
+import tempfile
+from unittest.mock import patch
+
+
+class TestProbeCache(unittest.TestCase):
+    def setUp(self) -> None:
+        self.tempdir = tempfile.mkdtemp()
+        self.env_path = os.path.join(self.tempdir, "env")
+        self.site_packages = os.path.join(
+            self.env_path, "lib", "python3.11", "site-packages"
+        )
+        os.makedirs(self.site_packages)
+
+    def tearDown(self) -> None:
+        shutil.rmtree(self.tempdir)
+
+    def test_get_put(self):
+        from envpicker.manager.probe_cache import ProbeCache
+
+        cache = ProbeCache(os.path.join(self.tempdir, "cache"))
+        key = ProbeCache.key("hash", "fp", "print(1)")
+        self.assertNotEqual(key, ProbeCache.key("hash", "fp2", "print(1)"))
+        self.assertIsNone(cache.get(key, self.env_path))
+        chunks = [(b"1\n", b""), (b"", b"\xff")]
+        self.assertTrue(cache.put(key, self.env_path, chunks))
+        self.assertEqual(cache.get(key, self.env_path), chunks)
+
+    def test_invalidated_by_environment_change(self):
+        from envpicker.manager.probe_cache import ProbeCache
+
+        cache = ProbeCache(os.path.join(self.tempdir, "cache"))
+        key = ProbeCache.key("hash", "fp", "print(1)")
+        cache.put(key, self.env_path, [(b"1\n", b"")])
+        time.sleep(0.01)
+        os.makedirs(os.path.join(self.site_packages, "numpy"))
+        self.assertIsNone(cache.get(key, self.env_path))
+        self.assertEqual(os.listdir(cache.path), [])
+
+    def test_lru_eviction(self):
+        from envpicker.manager.probe_cache import ProbeCache
+
+        cache = ProbeCache(os.path.join(self.tempdir, "cache"), max_bytes=600)
+        chunks = [(b"x" * 100, b"")]
+        keys = [ProbeCache.key("hash", "fp", f"print({i})") for i in range(3)]
+        for key in keys[:2]:
+            cache.put(key, self.env_path, chunks)
+            time.sleep(0.01)
+        # the first entry is used more recently than the second one
+        self.assertIsNotNone(cache.get(keys[0], self.env_path))
+        time.sleep(0.01)
+        cache.put(keys[2], self.env_path, chunks)
+        self.assertIsNotNone(cache.get(keys[0], self.env_path))
+        self.assertIsNone(cache.get(keys[1], self.env_path))
+        self.assertIsNotNone(cache.get(keys[2], self.env_path))
+        self.assertFalse(cache.put(keys[1], self.env_path, [(b"x" * 1000, b"")]))
+
+
+class TestRunProbe(unittest.TestCase):
+    def setUp(self) -> None:
+        from envpicker.manager.base import BaseEnvManager
+
+        class MockBaseEnvManager(BaseEnvManager):
+            @classmethod
+            def is_available(cls):
+                return True
+
+            @classmethod
+            def register_all(cls):
+                pass
+
+            def get_dependencies(self, env):
+                return ["numpy==1.0"]
+
+        self.tempdir = tempfile.mkdtemp()
+        env_path = os.path.join(self.tempdir, "env")
+        os.makedirs(os.path.join(env_path, "lib", "python3.11", "site-packages"))
+        self.cls = MockBaseEnvManager
+        self.manager = MockBaseEnvManager(
+            path=os.path.join(self.tempdir, "registry"), probe_cache_size=1024 * 1024
+        )
+        self.env = self.manager.add_env(env_path, sys.executable, name="env")
+        del self.env["envdata"]
+
+    def tearDown(self) -> None:
+        shutil.rmtree(self.tempdir)
+
+    def test_cache_hit_does_not_spawn(self):
+        command = "import sys; print('probe'); sys.stderr.write('err')"
+        first = list(self.manager.run_probe(self.env, command))
+        self.assertIn(b"probe", b"".join(out for out, _ in first))
+
+        with patch("envpicker.manager.base.popen_in_group") as popen:
+            second = list(self.manager.run_probe(self.env, command))
+        popen.assert_not_called()
+        self.assertEqual(first, second)
+
+        # the cache is persisted in the registry directory
+        manager = self.cls(path=self.manager.path, probe_cache_size=1024 * 1024)
+        with patch("envpicker.manager.base.popen_in_group") as popen:
+            self.assertEqual(list(manager.run_probe(self.env, command)), first)
+        popen.assert_not_called()
+
+    def test_failures_are_not_cached(self):
+        from envpicker.manager.base import ProcessError
+
+        for _ in range(2):
+            with self.assertRaises(ProcessError):
+                list(self.manager.run_probe(self.env, "import sys; sys.exit(1)"))
+        self.assertEqual(os.listdir(self.manager.probe_cache.path), [])
+
+    def test_disabled_by_default(self):
+        manager = self.cls(path=self.manager.path)
+        self.assertIsNone(manager.probe_cache)
+        output = list(manager.run_probe(self.env, "print('probe')"))
+        self.assertIn(b"probe", b"".join(out for out, _ in output))
@@ -0,0 +1,51 @@
+import unittest
+
+
+class TestRecords(unittest.TestCase):
+    def test_shared_versions(self):
+        from envpicker.manager.records import EnvRecord
+
+        env1 = EnvRecord("hash1", ["NumPy==1.19.0", "python=3.9.1"])
+        env2 = EnvRecord("hash2", ["numpy==1.19.0", "pandas==1.5.0"])
+        self.assertEqual(sorted(env1.packages), ["numpy", "python"])
+        self.assertIs(env1.packages["numpy"].version, env2.packages["numpy"].version)
+        self.assertIs(env1.packages["numpy"].name, env2.packages["numpy"].name)
+
+    def test_normalized_names(self):
+        from envpicker.manager.records import EnvRecord, Requirement
+
+        env = EnvRecord("hash", ["typing-extensions=4.5.0", "ruamel.yaml==0.17"])
+        self.assertEqual(sorted(env.packages), ["ruamel-yaml", "typing-extensions"])
+        requirements = [Requirement("typing_extensions>=4"), Requirement("Ruamel_YAML")]
+        self.assertEqual(env.unmet(requirements), [])
+
+    def test_slots(self):
+        from envpicker.manager.records import EnvRecord, PackageRecord
+
+        record = PackageRecord("numpy", "==1.19.0")
+        with self.assertRaises(AttributeError):
+            record.__dict__
+        with self.assertRaises(AttributeError):
+            EnvRecord("hash", []).__dict__
+
+    def test_matches_like_matches_version(self):
+        from envpicker.manager.records import EnvRecord, Requirement
+        from envpicker.utils import matches_version, split_version
+
+        deps = ["numpy==1.19.0", "python=3.9.1", "scipy=1.10.0", "flask==2.0.1"]
+        env = EnvRecord("hash", deps)
+        packages = {split_version(d)["pkg"]: split_version(d) for d in deps}
+        for req in [
+            "numpy>=1.20",
+            "numpy>=1.19,<2",
+            "python==3.9.1",
+            "python>3.9.1",
+            "scipy<=1.10",
+            "pandas>=1",
+        ]:
+            cond = split_version(req)
+            expected = cond["pkg"] in packages and matches_version(
+                cond["vstring"], packages[cond["pkg"]]["vstring"]
+            )
+            unmet = env.unmet([Requirement(req)])
+            self.assertEqual(not unmet, expected, req)
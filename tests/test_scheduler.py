@@ -0,0 +1,156 @@
+import unittest
+import os
+import sys
+import time
+import shutil
+import tempfile
+import subprocess
+import threading
+
+
+class TestRunScheduler(unittest.TestCase):
+    def test_invalid_limits(self):
+        from envpicker.manager.scheduler import RunScheduler
+
+        with self.assertRaises(ValueError):
+            RunScheduler(max_parallel=0)
+        with self.assertRaises(ValueError):
+            RunScheduler(max_per_env=0)
+
+    def test_limits(self):
+        from envpicker.manager.scheduler import RunScheduler
+
+        scheduler = RunScheduler(max_parallel=3, max_per_env=1)
+        running = {"total": 0, "max_total": 0, "env": {}, "max_env": 0}
+        lock = threading.Lock()
+
+        def job(env_hash):
+            with scheduler.slot(env_hash):
+                with lock:
+                    running["total"] += 1
+                    running["env"][env_hash] = running["env"].get(env_hash, 0) + 1
+                    running["max_total"] = max(running["max_total"], running["total"])
+                    running["max_env"] = max(
+                        running["max_env"], running["env"][env_hash]
+                    )
+                time.sleep(0.05)
+                with lock:
+                    running["total"] -= 1
+                    running["env"][env_hash] -= 1
+
+        threads = [
+            threading.Thread(target=job, args=(f"env{i % 4}",)) for i in range(12)
+        ]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        self.assertLessEqual(running["max_total"], 3)
+        self.assertEqual(running["max_env"], 1)
+        self.assertEqual(scheduler.running, 0)
+        self.assertEqual(scheduler.waiting, 0)
+
+    def test_queue_wait(self):
+        from envpicker.manager.scheduler import RunScheduler
+
+        scheduler = RunScheduler(max_parallel=1)
+        waits = []
+
+        def job():
+            with scheduler.slot("env") as wait:
+                waits.append(wait)
+                time.sleep(0.1)
+
+        threads = [threading.Thread(target=job) for _ in range(2)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        self.assertGreaterEqual(max(waits), 0.05)
+
+
+class TestRunInEnv(unittest.TestCase):
+    def setUp(self) -> None:
+        self.tempdir = tempfile.mkdtemp()
+        self.env = {
+            "hash": "hash",
+            "path": self.tempdir,
+            "name": "env",
+            "py_executable": sys.executable,
+        }
+
+    def tearDown(self) -> None:
+        shutil.rmtree(self.tempdir)
+
+    def test_report(self):
+        from envpicker.manager.base import BaseEnvManager
+
+        gen = BaseEnvManager.run_py_in_env(self.env, "print('hello')")
+        out = b""
+        while True:
+            try:
+                stdout, _ = next(gen)
+                out += stdout
+            except StopIteration as stop:
+                report = stop.value
+                break
+        self.assertIn(b"hello", out)
+        self.assertEqual(report["returncode"], 0)
+        self.assertGreater(report["run_time"], 0)
+        self.assertGreaterEqual(report["queue_wait"], 0)
+
+    def test_nonzero_exit(self):
+        from envpicker.manager.base import BaseEnvManager, ProcessError
+
+        with self.assertRaises(ProcessError) as ctx:
+            list(
+                BaseEnvManager.run_py_in_env(
+                    self.env, "import sys; sys.stderr.write('broken'); sys.exit(2)"
+                )
+            )
+        self.assertEqual(ctx.exception.returncode, 2)
+        self.assertIn("broken", str(ctx.exception))
+
+    def test_timeout(self):
+        from envpicker.manager.base import BaseEnvManager
+
+        start = time.monotonic()
+        with self.assertRaises(subprocess.TimeoutExpired):
+            list(
+                BaseEnvManager.run_py_in_env(
+                    self.env, "import time; time.sleep(30)", timeout=0.5
+                )
+            )
+        self.assertLess(time.monotonic() - start, 10)
+
+    @unittest.skipIf(os.name == "nt", "process groups are tested on posix only")
+    def test_close_kills_grandchildren(self):
+        from envpicker.manager.base import BaseEnvManager
+
+        pidfile = os.path.join(self.tempdir, "pid")
+        command = (
+            "import subprocess, sys, time\n"
+            "p = subprocess.Popen([sys.executable, '-c', 'import time; time.sleep(30)'])\n"
+            f"open({pidfile!r}, 'w').write(str(p.pid))\n"
+            "print('started', flush=True)\n"
+            "time.sleep(30)\n"
+        )
+        gen = BaseEnvManager.run_py_in_env(self.env, command)
+        for stdout, _ in gen:
+            if b"started" in stdout:
+                break
+        gen.close()
+        with open(pidfile) as f:
+            pid = int(f.read())
+        deadline = time.monotonic() + 5
+        alive = True
+        while alive and time.monotonic() < deadline:
+            try:
+                os.kill(pid, 0)
+                # zombies of the killed group are reaped by init eventually
+                with open(f"/proc/{pid}/stat") as f:
+                    alive = f.read().split()[2] != "Z"
+            except (ProcessLookupError, FileNotFoundError):
+                alive = False
+            time.sleep(0.05)
+        self.assertFalse(alive)
@@ -133,3 +133,174 @@ class TestVersionUtils(unittest.TestCase):
 
         with self.assertRaises(packaging.specifiers.InvalidSpecifier):
             assert not matches_version("malformed", "1.5")
+
+
+class TestLockUtils(unittest.TestCase):
+    def test_exact_pin(self):
+        from envpicker.utils import exact_pin
+
+        self.assertEqual(exact_pin("numpy==1.19.0"), ("numpy", "1.19.0"))
+        self.assertEqual(exact_pin("numpy=1.19.0"), ("numpy", "1.19.0"))
+        self.assertEqual(exact_pin("numpy=1.19.0=py39_0"), ("numpy", "1.19.0"))
+        self.assertEqual(exact_pin("PyYAML==6.0"), ("pyyaml", "6.0"))
+        self.assertIsNone(exact_pin("numpy>=1.19"))
+        self.assertIsNone(exact_pin("numpy=1.*"))
+        self.assertIsNone(exact_pin("numpy==1.19,<2"))
+
+    def test_package_fingerprint(self):
+        from envpicker.utils import package_fingerprint
+
+        self.assertEqual(
+            package_fingerprint(["numpy=1.19.0", "PyYAML==6.0"]),
+            package_fingerprint(["pyyaml==6.0", "numpy==1.19.0", "numpy==1.19.0"]),
+        )
+        self.assertNotEqual(
+            package_fingerprint(["numpy==1.19.0"]),
+            package_fingerprint(["numpy==1.19.1"]),
+        )
+        self.assertEqual(
+            package_fingerprint(["numpy==1.19"]),
+            package_fingerprint(["numpy=1.19.0"]),
+        )
+
+    def test_read_lock_entries(self):
+        import os
+        import tempfile
+        from envpicker.utils import read_lock_entries
+
+        tempdir = tempfile.mkdtemp()
+        try:
+            requirements = os.path.join(tempdir, "requirements.txt")
+            with open(requirements, "w") as f:
+                f.write(
+                    "# locked\n"
+                    "-i https://pypi.org/simple\n"
+                    "numpy==1.19.0 \\\n"
+                    "    --hash=sha256:abc\n"
+                    'pandas==1.5.0 ; python_version >= "3.8"\n'
+                    "\n"
+                    "scipy>=1.10  # range\n"
+                )
+            self.assertEqual(
+                read_lock_entries(requirements),
+                ["numpy==1.19.0", "pandas==1.5.0", "scipy>=1.10"],
+            )
+
+            explicit = os.path.join(tempdir, "spec.txt")
+            with open(explicit, "w") as f:
+                f.write(
+                    "# platform: linux-64\n"
+                    "@EXPLICIT\n"
+                    "https://conda.anaconda.org/conda-forge/linux-64/numpy-1.19.0-py39_0.tar.bz2\n"
+                    "https://conda.anaconda.org/conda-forge/noarch/tzdata-2023c-h71feb2d_0.conda#abc\n"
+                )
+            self.assertEqual(
+                read_lock_entries(explicit), ["numpy==1.19.0", "tzdata==2023c"]
+            )
+
+            env_yaml = os.path.join(tempdir, "environment.yml")
+            with open(env_yaml, "w") as f:
+                f.write(
+                    "name: test\ndependencies:\n  - numpy=1.19.0\n  - pip:\n    - pandas==1.5.0\n"
+                )
+            self.assertEqual(
+                read_lock_entries(env_yaml), ["numpy=1.19.0", "pandas==1.5.0"]
+            )
+        finally:
+            import shutil
+
+            shutil.rmtree(tempdir)
+
+
+class TestImportUtils(unittest.TestCase):
+    def setUp(self) -> None:
+        import tempfile
+
+        self.tempdir = tempfile.mkdtemp()
+
+    def tearDown(self) -> None:
+        import shutil
+
+        shutil.rmtree(self.tempdir)
+
+    def _write(self, relpath, content=""):
+        import os
+
+        path = os.path.join(self.tempdir, relpath)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "w") as f:
+            f.write(content)
+        return path
+
+    def test_distribution_modules(self):
+        from envpicker.utils import distribution_modules
+
+        sp = "lib/python3.11/site-packages"
+        self._write(f"{sp}/PyYAML-6.0.dist-info/top_level.txt", "_yaml\nyaml\n")
+        self._write(
+            f"{sp}/six-1.16.0.dist-info/RECORD",
+            "six.py,sha256=x,100\n"
+            "six-1.16.0.dist-info/METADATA,,\n"
+            "__pycache__/six.cpython-311.pyc,,\n",
+        )
+        self._write(
+            f"{sp}/scikit_learn-1.3.0.dist-info/RECORD",
+            "sklearn/__init__.py,,\n../../../bin/tool,,\n",
+        )
+        self._write(f"{sp}/broken-1.0.dist-info/METADATA")
+        self.assertEqual(
+            distribution_modules(self.tempdir),
+            {
+                "_yaml": "pyyaml",
+                "yaml": "pyyaml",
+                "six": "six",
+                "sklearn": "scikit-learn",
+            },
+        )
+
+    def test_script_imports(self):
+        from envpicker.utils import script_imports
+
+        self._write("helper.py")
+        path = self._write(
+            "script.py",
+            "import os, numpy as np\n"
+            "import yaml.loader\n"
+            "from sklearn.linear_model import LinearRegression\n"
+            "from . import relative\n"
+            "import helper\n"
+            "try:\n"
+            "    import ujson as json\n"
+            "except ImportError:\n"
+            "    import json\n"
+            "def f():\n"
+            "    import pandas\n",
+        )
+        self.assertEqual(
+            script_imports(path), ["numpy", "pandas", "sklearn", "yaml"]
+        )
+
+    def test_stdlib_fallback(self):
+        import sys
+        from unittest.mock import patch
+        import envpicker.utils as utils
+
+        # python < 3.10 has no sys.stdlib_module_names
+        fake_sys = type(
+            "FakeSys",
+            (),
+            {
+                "builtin_module_names": sys.builtin_module_names,
+                "base_prefix": sys.base_prefix,
+            },
+        )
+        with patch.object(utils, "sys", fake_sys), patch.object(
+            utils, "_STDLIB_MODULES", None
+        ):
+            modules = utils.stdlib_modules()
+            path = self._write("script.py", "import os, json, math\nimport numpy\n")
+            self.assertEqual(utils.script_imports(path), ["numpy"])
+        for name in ("os", "json", "math", "sys", "collections", "__future__"):
+            self.assertIn(name, modules)
+        self.assertNotIn("numpy", modules)
+        self.assertNotIn("site-packages", modules)
@@ -0,0 +1,112 @@
+import unittest
+from unittest.mock import Mock
+import os
+import sys
+import shutil
+import tempfile
+import time
+import threading
+
+
+def make_env(root, name):
+    path = os.path.join(root, name)
+    os.makedirs(os.path.join(path, "conda-meta"))
+    os.makedirs(os.path.join(path, "lib", "python3.9", "site-packages"))
+    with open(os.path.join(path, "conda-meta", "history"), "w") as f:
+        f.write("==> init <==\n")
+    return path
+
+
+class TestEnvWatcher(unittest.TestCase):
+    def setUp(self) -> None:
+        self.tempdir = tempfile.mkdtemp()
+        self.envs_dir = os.path.join(self.tempdir, "envs")
+        os.makedirs(self.envs_dir)
+        self.env_path = make_env(self.envs_dir, "env1")
+        self.manager = Mock()
+        self.manager.registry_lock = threading.RLock()
+        self.manager.environments = [
+            {
+                "hash": "hash1",
+                "path": self.env_path,
+                "name": "env1",
+                "py_executable": os.path.join(self.env_path, "bin", "python"),
+            }
+        ]
+        self.manager.watch_dirs.return_value = [self.envs_dir]
+
+    def tearDown(self) -> None:
+        shutil.rmtree(self.tempdir)
+
+    def test_env_signature(self):
+        from envpicker.utils import env_signature
+
+        sig = env_signature(self.env_path)
+        time.sleep(0.01)
+        with open(os.path.join(self.env_path, "conda-meta", "history"), "a") as f:
+            f.write("# cmd: conda install numpy\n")
+        self.assertNotEqual(sig, env_signature(self.env_path))
+        self.assertIsNone(env_signature(os.path.join(self.tempdir, "missing")))
+
+    def test_candidate_envs(self):
+        from envpicker.watcher import EnvWatcher
+
+        env2 = make_env(self.envs_dir, "env2")
+        os.makedirs(os.path.join(self.envs_dir, "not_an_env"))
+        watcher = EnvWatcher(self.manager)
+        self.assertEqual(watcher.candidate_envs(), {self.env_path, env2})
+
+    def test_sync(self):
+        from envpicker.watcher import EnvWatcher
+
+        env2 = make_env(self.envs_dir, "env2")
+        watcher = EnvWatcher(self.manager)
+        watcher.sync([self.env_path, env2])
+        self.manager.create_env_yaml.assert_called_once_with(
+            self.manager.environments[0]
+        )
+        self.manager.register_environment.assert_called_once_with(
+            path=env2, name="env2"
+        )
+
+        shutil.rmtree(self.env_path)
+        watcher.sync([self.env_path])
+        self.manager.remove_env.assert_called_once_with(self.env_path)
+
+    def _check_backend(self, backend):
+        from envpicker.watcher import EnvWatcher
+
+        watcher = EnvWatcher(
+            self.manager, debounce=0.2, poll_interval=0.05, backend=backend
+        )
+        with watcher:
+            time.sleep(0.3)
+            site_packages = os.path.join(
+                self.env_path, "lib", "python3.9", "site-packages"
+            )
+            # a burst of changes results in a single update
+            for i in range(5):
+                os.makedirs(os.path.join(site_packages, f"pkg{i}-1.0.dist-info"))
+                time.sleep(0.02)
+            deadline = time.monotonic() + 5
+            while (
+                not self.manager.create_env_yaml.called and time.monotonic() < deadline
+            ):
+                time.sleep(0.05)
+            time.sleep(0.3)
+        self.manager.create_env_yaml.assert_called_once_with(
+            self.manager.environments[0]
+        )
+
+    def test_polling_backend(self):
+        self._check_backend("poll")
+
+    @unittest.skipUnless(sys.platform.startswith("linux"), "inotify requires linux")
+    def test_inotify_backend(self):
+        self._check_backend("inotify")
+
+    def test_invalid_backend(self):
+        from envpicker.watcher import EnvWatcher
+
+        with self.assertRaises(ValueError):
+            EnvWatcher(self.manager, backend="dummy")